@@ -1,5 +1,21 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
 
 
 class BooksConfig(AppConfig):
     name = 'books'
+
+    def ready(self):
+        from .db import configure_connection
+        from .metrics import install_query_recorder
+
+        connection_created.connect(configure_connection)
+        connection_created.connect(install_query_recorder)
+
+        if settings.SNAPSHOT_MODE == 'replica':
+            from .snapshots import close_outdated_connections, record_database_name
+
+            connection_created.connect(record_database_name)
+            request_started.connect(close_outdated_connections)
@@ -0,0 +1,139 @@
+"""
+This suggests book titles and author names for what a user has typed so far.
+
+Each process builds a prefix index the first time it's needed after each
+catalog update. Titles and names are ranked by downloads, and each one is
+findable by the start of any of its words. The index is a sorted list of
+normalized keys, so a prefix's matches are one contiguous range found by
+binary search. The best matches for short prefixes, whose ranges are huge,
+are worked out when the index is built.
+"""
+
+from array import array
+from bisect import bisect_left
+from heapq import nsmallest
+from threading import Lock
+
+from django.db.models import Sum
+
+from .catalog import get_catalog_version
+from .models import Book, Person
+from .utils import normalize
+
+
+# Prefixes up to this long have their best matches worked out in advance.
+SHORT_PREFIX_LENGTH = 3
+
+# Keys are cut to this length to keep the index small. Longer prefixes
+# are cut the same way before lookups, so they only lose precision.
+MAX_KEY_LENGTH = 24
+
+# Only this many words of each title or name can start a match.
+MAX_KEY_WORDS = 12
+
+MAX_RESULTS = 20
+
+_index = None
+_index_lock = Lock()
+
+
+class PrefixIndex:
+    def __init__(self, entries):
+        """
+        `entries` is a list of (type, text, gutenberg_id, download_count)
+        tuples. Each entry's rank is its position after sorting them by
+        downloads, so smaller entry numbers are better matches.
+        """
+
+        entries.sort(key=lambda entry: (-entry[3], entry[1]))
+        self.entries = entries
+
+        keyed_entries = []
+        for number, entry in enumerate(entries):
+            words = normalize(entry[1]).split()[:MAX_KEY_WORDS]
+            for position, word in enumerate(words):
+                # Short words in the middle of titles are rarely typed first.
+                if position == 0 or len(word) > 2:
+                    key = ' '.join(words[position:])[:MAX_KEY_LENGTH]
+                    keyed_entries.append((key, number))
+        keyed_entries.sort()
+
+        self.keys = [key for key, _ in keyed_entries]
+        self.key_entries = array('I', (number for _, number in keyed_entries))
+
+        # Keys are visited in rank order, so each short prefix's list fills
+        # up with its best matches first.
+        self.short_prefix_entries = {}
+        for number, key in sorted(
+            zip(self.key_entries, self.keys), key=lambda pair: pair[0]
+        ):
+            for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                numbers = self.short_prefix_entries.setdefault(key[:length], [])
+                if len(numbers) < MAX_RESULTS and number not in numbers[-1:]:
+                    numbers.append(number)
+
+    def search(self, text, limit):
+        prefix = normalize(text)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            numbers = self.short_prefix_entries.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\U0010ffff', start)
+            numbers = nsmallest(limit, set(self.key_entries[start:end]))
+
+        return [self.entries[number] for number in numbers]
+
+
+def build_index():
+    entries = [
+        ('title', title, gutenberg_id, download_count)
+        for title, gutenberg_id, download_count in Book.objects.listed().values_list(
+            'title', 'gutenberg_id', 'download_count'
+        ).iterator()
+    ]
+
+    # Authors are ranked by the downloads of all of their books.
+    entries += [
+        ('author', name, None, download_count)
+        for name, download_count in Person.objects.values_list('name').annotate(
+            download_count=Sum('book__download_count')
+        ).filter(download_count__isnull=False).order_by().iterator()
+    ]
+
+    return PrefixIndex(entries)
+
+
+def get_index():
+    """ This gives a prefix index of the latest catalog version. """
+
+    global _index
+
+    version = get_catalog_version()
+    if _index is None or _index[0] != version:
+        with _index_lock:
+            if _index is None or _index[0] != version:
+                _index = (version, build_index())
+
+    return _index[1]
+
+
+def get_suggestions(text, limit=10):
+    """
+    This gives up to `limit` titles and author names with a word starting
+    with `text`, most downloaded first.
+    """
+
+    limit = max(1, min(limit, MAX_RESULTS))
+    return [
+        {
+            'type': type,
+            'text': suggestion,
+            'gutenberg_id': gutenberg_id,
+            'download_count': download_count,
+        }
+        for type, suggestion, gutenberg_id, download_count
+        in get_index().search(text, limit)
+    ]
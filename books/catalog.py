@@ -0,0 +1,38 @@
+from time import monotonic
+
+from .models import CatalogVersion
+
+
+# This is how long (in seconds) each process trusts the catalog version it
+# last read before checking the database again.
+VERSION_CHECK_INTERVAL = 10
+
+_version = None
+_version_checked_at = None
+
+
+def get_catalog_version():
+    """
+    This gives the ID of the latest catalog version, or 0 if the catalog has
+    never been updated. It is used to key caches, so cached data expires
+    with each catalog update and never has to be invalidated by hand.
+    """
+
+    global _version, _version_checked_at
+
+    now = monotonic()
+    if _version_checked_at is None or now - _version_checked_at > VERSION_CHECK_INTERVAL:
+        _version = CatalogVersion.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        _version_checked_at = now
+
+    return _version
+
+
+def expire_catalog_version():
+    """ This has the catalog version read again when it is next needed. """
+
+    global _version_checked_at
+
+    _version_checked_at = None
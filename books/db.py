@@ -0,0 +1,33 @@
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """ This tunes each new database connection for serving the API. """
+
+    if connection.vendor == 'sqlite':
+        configure_sqlite_connection(connection)
+    elif connection.vendor == 'postgresql':
+        configure_postgresql_connection(connection)
+
+
+def configure_postgresql_connection(connection):
+    if settings.DATABASE_QUERY_ONLY:
+        with connection.cursor() as cursor:
+            cursor.execute('SET default_transaction_read_only = on')
+
+
+def configure_sqlite_connection(connection):
+    with connection.cursor() as cursor:
+        if not settings.DATABASE_QUERY_ONLY:
+            # WAL mode is stored in the database file, so this only has to
+            # succeed once, e.g. when migrating. Readers then never wait for
+            # the catalog updater, and it never waits for them.
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+
+        cursor.execute('PRAGMA mmap_size=%d' % settings.DATABASE_MMAP_SIZE)
+        cursor.execute('PRAGMA cache_size=%d' % settings.DATABASE_CACHE_SIZE)
+        cursor.execute('PRAGMA temp_store=MEMORY')
+
+        if settings.DATABASE_QUERY_ONLY:
+            cursor.execute('PRAGMA query_only=ON')
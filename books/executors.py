@@ -0,0 +1,15 @@
+"""
+This holds the thread pool that async views and middleware run their
+synchronous work in, so that it can be shared without importing the views.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+# This runs the database work of async views.
+async_view_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_API_THREADS,
+    thread_name_prefix='async-api'
+)
@@ -0,0 +1,82 @@
+"""
+This counts books by language, bookshelf, copyright status, and media type.
+Counts for the whole catalog are worked out once per catalog update and
+stored with its version. Counts for filtered lists take one grouped query
+per dimension, however many values each dimension has.
+"""
+
+from django.db.models import Count
+
+from .catalog import get_catalog_version
+from .models import Book, CatalogVersion
+
+
+# These are the query parameters that narrow down lists of books.
+FILTER_PARAMETERS = (
+    'author_year_end',
+    'author_year_start',
+    'copyright',
+    'ids',
+    'languages',
+    'mime_type',
+    'search',
+    'topic',
+)
+
+COPYRIGHT_KEYS = {True: 'true', False: 'false', None: 'null'}
+
+_catalog_facets = None
+_catalog_facets_version = None
+
+
+def count_by(queryset, field):
+    """ This gives a dictionary of the number of rows with each `field` value. """
+
+    rows = queryset.order_by().values_list(field).annotate(count=Count('*'))
+    return {value: count for value, count in rows}
+
+
+def get_facet_counts(book_ids):
+    """
+    This counts the books whose IDs are given by the `book_ids` queryset,
+    which is used as a subquery.
+    """
+
+    books = Book.objects.filter(id__in=book_ids)
+    book_languages = Book.languages.through.objects.filter(book_id__in=book_ids)
+    book_bookshelves = Book.bookshelves.through.objects.filter(
+        book_id__in=book_ids
+    )
+
+    copyright_counts = count_by(books, 'copyright')
+
+    return {
+        'count': books.count(),
+        'facets': {
+            'bookshelves': count_by(book_bookshelves, 'bookshelf__name'),
+            'copyright': {
+                COPYRIGHT_KEYS[value]: count
+                for value, count in copyright_counts.items()
+            },
+            'languages': count_by(book_languages, 'language__code'),
+            'media_type': count_by(books, 'media_type'),
+        },
+    }
+
+
+def get_catalog_facets():
+    """
+    This gives the facet counts stored with the latest catalog version,
+    reading them from the database only after the version changes.
+    """
+
+    global _catalog_facets, _catalog_facets_version
+
+    version = get_catalog_version()
+    if version != _catalog_facets_version:
+        _catalog_facets = CatalogVersion.objects.filter(id=version).values_list(
+            'facets', flat=True
+        ).first()
+        _catalog_facets_version = version
+
+    return _catalog_facets
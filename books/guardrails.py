@@ -0,0 +1,129 @@
+"""
+This keeps a few expensive book list requests from tying up the server.
+Requests whose filter parameters would make a very costly query are turned
+away before any SQL runs, and statements that run too long are stopped.
+"""
+
+from contextlib import contextmanager
+from time import monotonic
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+from rest_framework import exceptions as drf_exceptions
+
+
+# These are rough costs of the joins and scans that filter parameters add.
+PARAMETER_COSTS = {
+    'author_year_end': 1,
+    'author_year_start': 1,
+    'languages': 2,
+    'mime_type': 3,
+    'topic': 6,
+}
+SEARCH_TERM_COST = 4
+
+# SQLite calls its progress handler after this many virtual machine steps.
+PROGRESS_HANDLER_STEPS = 10000
+
+POSTGRES_QUERY_CANCELED = '57014'
+
+
+class QueryTooComplex(drf_exceptions.APIException):
+    status_code = 400
+    default_detail = 'This query is too complex. Try fewer search terms or filters.'
+    default_code = 'query_too_complex'
+
+
+class QueryTimedOut(drf_exceptions.APIException):
+    status_code = 503
+    default_detail = 'This query took too long. Try narrowing it down.'
+    default_code = 'query_timed_out'
+
+
+def estimate_query_cost(query_params):
+    cost = sum(
+        parameter_cost
+        for parameter, parameter_cost in PARAMETER_COSTS.items()
+        if parameter in query_params
+    )
+
+    search_string = query_params.get('search')
+    if search_string is not None:
+        # These are split the same way as by the book list.
+        cost += SEARCH_TERM_COST * len(search_string.split(' ')[:32])
+
+    # Page depth doesn't count, as only the sorted IDs are skipped over.
+    return cost
+
+
+def check_query_cost(query_params):
+    """ This raises `QueryTooComplex` for requests over QUERY_COST_LIMIT. """
+
+    limit = settings.QUERY_COST_LIMIT
+    if limit and estimate_query_cost(query_params) > limit:
+        raise QueryTooComplex()
+
+
+@contextmanager
+def statement_time_limit():
+    """
+    This stops any SQL statement run inside it after QUERY_TIME_LIMIT
+    seconds, raising `QueryTimedOut`. SQLite statements are interrupted by a
+    progress handler, and PostgreSQL ones by `statement_timeout`.
+    """
+
+    seconds = settings.QUERY_TIME_LIMIT
+    if not seconds:
+        yield
+        return
+
+    if connection.vendor == 'sqlite':
+        with sqlite_time_limit(seconds):
+            yield
+    elif connection.vendor == 'postgresql':
+        with postgresql_time_limit(seconds):
+            yield
+    else:
+        yield
+
+
+@contextmanager
+def sqlite_time_limit(seconds):
+    deadline = [None]
+
+    def start_statement(execute, sql, params, many, context):
+        deadline[0] = monotonic() + seconds
+        return execute(sql, params, many, context)
+
+    def check_deadline():
+        # A true value interrupts the statement.
+        return deadline[0] is not None and monotonic() > deadline[0]
+
+    connection.ensure_connection()
+    sqlite_connection = connection.connection
+    sqlite_connection.set_progress_handler(check_deadline, PROGRESS_HANDLER_STEPS)
+    try:
+        with connection.execute_wrapper(start_statement):
+            yield
+    except OperationalError as error:
+        if check_deadline() and 'interrupted' in str(error):
+            raise QueryTimedOut() from error
+        raise
+    finally:
+        sqlite_connection.set_progress_handler(None, 0)
+
+
+@contextmanager
+def postgresql_time_limit(seconds):
+    with connection.cursor() as cursor:
+        cursor.execute('SET statement_timeout = %s', [int(seconds * 1000)])
+    try:
+        yield
+    except OperationalError as error:
+        if getattr(error.__cause__, 'pgcode', None) == POSTGRES_QUERY_CANCELED:
+            raise QueryTimedOut() from error
+        raise
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('RESET statement_timeout')
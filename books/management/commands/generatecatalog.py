@@ -0,0 +1,368 @@
+from bisect import bisect
+from itertools import accumulate
+from random import Random
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from books.facets import get_facet_counts
+from books.management.commands.updatecatalog import (
+    update_book_author_years,
+    update_book_sort_keys,
+    update_person_stats,
+)
+from books.models import *
+from books.related import update_related_books
+from books.storage import split_url
+from books.trending import update_trending_books
+
+
+# These are rough proportions of Project Gutenberg's catalog, per book.
+PEOPLE_PER_BOOK = 0.5
+SUBJECTS_PER_BOOK = 0.55
+BOOKSHELF_COUNT = 340
+SUBJECTS_PER_LISTING = 3.2
+SUMMARY_CHANCE = 0.9
+
+LANGUAGE_WEIGHTS = {
+    'en': 800, 'fr': 48, 'fi': 38, 'de': 30, 'nl': 15, 'it': 13, 'es': 11,
+    'pt': 8, 'zh': 6, 'hu': 4, 'el': 3, 'sv': 3, 'la': 2, 'da': 2, 'eo': 2,
+    'ar': 1, 'ca': 1, 'cy': 1, 'ja': 1, 'no': 1, 'pl': 1, 'ru': 1, 'tl': 1,
+}
+MEDIA_TYPE_WEIGHTS = {
+    'Text': 960, 'Sound': 22, 'Image': 8, 'StillImage': 4, 'Collection': 2,
+    'Dataset': 2, 'MovingImage': 1, 'InteractiveResource': 1,
+}
+
+# These are the formats of a typical text, with the chance of each.
+TEXT_FORMATS = [
+    ('text/html', 'https://www.gutenberg.org/ebooks/%d.html.images', 1),
+    ('application/epub+zip', 'https://www.gutenberg.org/ebooks/%d.epub3.images', 1),
+    ('application/x-mobipocket-ebook', 'https://www.gutenberg.org/ebooks/%d.kf8.images', 1),
+    ('application/rdf+xml', 'https://www.gutenberg.org/ebooks/%d.rdf', 1),
+    ('image/jpeg', 'https://www.gutenberg.org/cache/epub/%d/pg%d.cover.medium.jpg', 0.95),
+    ('text/plain; charset=us-ascii', 'https://www.gutenberg.org/ebooks/%d.txt.utf-8', 0.9),
+    ('application/octet-stream', 'https://www.gutenberg.org/cache/epub/%d/pg%d-h.zip', 0.9),
+    ('text/plain; charset=utf-8', 'https://www.gutenberg.org/files/%d/%d-0.txt', 0.4),
+    ('text/html; charset=utf-8', 'https://www.gutenberg.org/files/%d/%d-h/%d-h.htm', 0.3),
+]
+SOUND_FORMATS = [
+    ('audio/mpeg', 'https://www.gutenberg.org/files/%d/mp3/%d-01.mp3', 1),
+    ('audio/ogg', 'https://www.gutenberg.org/files/%d/ogg/%d-01.ogg', 0.8),
+    ('application/rdf+xml', 'https://www.gutenberg.org/ebooks/%d.rdf', 1),
+]
+
+# These are given IDs in this order.
+MIME_TYPES = sorted({mime_type for mime_type, _, _ in TEXT_FORMATS + SOUND_FORMATS})
+
+FIRST_NAMES = (
+    'Agnes Albert Alexander Alice Ann Anthony Arthur Benjamin Charles Charlotte '
+    'Edgar Edith Edward Eleanor Elizabeth Emily Frances Francis Frederick '
+    'George Grace Harriet Henry Herbert Isaac Jane John Joseph Julia Louisa '
+    'Margaret Maria Mark Martha Mary Nathaniel Oliver Percy Rachel Richard '
+    'Robert Samuel Sarah Thomas Victor Walter William'
+).split()
+SURNAME_SYLLABLES = (
+    'ab al an ar ber bro by car dale den dor ell fer ford gar ham har hill '
+    'ing kin lan ley lor mar mer mon ner or rid ros sel ster ton vel wick win'
+).split()
+
+# Words are drawn for titles, subjects, and summaries, the first most often.
+WORDS = (
+    'history love war life great stories poems england world king letters '
+    'travels adventure children new old years man woman time house sea '
+    'journey voyage island city people country story book lady little '
+    'days night tales essays america france mystery young lord gold '
+    'memoirs home heart queen river mountain garden ship captain secret '
+    'diary father mother brother sister friend enemy prince princess road '
+    'light dark fire water spring summer autumn winter north south east '
+    'west empire revolution science nature art music philosophy religion '
+    'church school law trade farm forest desert castle village street '
+    'treasure ghost wonder magic dream song hymn sermon lecture account '
+    'narrative chronicle journal sketches studies notes lives works '
+    'complete collected selected volume part first second last early '
+    'modern ancient roman greek german french english scottish irish '
+    'indian chinese russian italian spanish western eastern southern '
+)
+WORDS = WORDS.split()
+
+SUBJECT_TOPICS = [
+    'Fiction', 'Juvenile fiction', 'History', 'Poetry', 'Drama', 'Biography',
+    'Travel', 'Description and travel', 'Social life and customs',
+    'Adventure stories', 'Love stories', 'Short stories', 'Science fiction',
+    'Detective and mystery stories', 'Historical fiction', 'Humorous stories',
+    'Fairy tales', 'Sea stories', 'War stories', 'Correspondence',
+    'Politics and government', 'Religion', 'Philosophy', 'Natural history',
+]
+SUBJECT_PLACES = [
+    'England', 'France', 'United States', 'London (England)', 'Paris (France)',
+    'Scotland', 'Ireland', 'Germany', 'Italy', 'India', 'China', 'Russia',
+    'Canada', 'Australia', 'Africa', 'Spain', 'Greece', 'Rome', 'Egypt',
+]
+SUBJECT_PERIODS = [
+    '17th century', '18th century', '19th century', '20th century',
+    'Civil War, 1861-1865', 'Revolution, 1789-1799', 'Middle Ages',
+]
+BOOKSHELF_PREFIXES = ['Category: ', 'Browsing: ', '']
+
+BOOK_BATCH_SIZE = 2000
+
+
+def get_zipf_weights(count, exponent=1.0):
+    """ This gives cumulative weights favouring the first of `count` items. """
+
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def make_picker(rng, items, cum_weights):
+    total = cum_weights[-1]
+    return lambda: items[bisect(cum_weights, rng.random() * total)]
+
+
+def make_words(rng, pick_word, count):
+    return ' '.join(pick_word() for _ in range(count))
+
+
+def make_people(rng, count):
+    names = set()
+    people = []
+    while len(people) < count:
+        surname = ''.join(
+            rng.choice(SURNAME_SYLLABLES) for _ in range(rng.randint(2, 3))
+        ).capitalize()
+        name = '%s, %s' % (surname, rng.choice(FIRST_NAMES))
+        birth_year = rng.randint(1500, 1960) if rng.random() < 0.8 else None
+        death_year = None
+        if birth_year is not None and birth_year < 1940 and rng.random() < 0.95:
+            death_year = birth_year + rng.randint(25, 95)
+        if (name, birth_year) in names:
+            continue
+        names.add((name, birth_year))
+        people.append(Person(
+            id=len(people) + 1,
+            name=name,
+            birth_year=birth_year,
+            death_year=death_year
+        ))
+    return people
+
+
+def make_subject_names(rng, count):
+    names = set()
+    while len(names) < count:
+        parts = []
+        if rng.random() < 0.5:
+            parts.append(rng.choice(SUBJECT_PLACES))
+        elif rng.random() < 0.5:
+            parts.append(make_words(rng, lambda: rng.choice(WORDS), 2).title())
+        if rng.random() < 0.4:
+            parts.append(rng.choice(SUBJECT_PERIODS))
+        parts.append(rng.choice(SUBJECT_TOPICS))
+        names.add(' -- '.join(parts)[:256])
+    return sorted(names)
+
+
+def make_bookshelf_names(rng, count):
+    names = set()
+    while len(names) < count:
+        words = make_words(rng, lambda: rng.choice(WORDS), rng.randint(1, 3))
+        names.add((rng.choice(BOOKSHELF_PREFIXES) + words.title())[:64])
+    return sorted(names)
+
+
+def reset_sequences(models):
+    """ This moves PostgreSQL's ID sequences past the IDs given explicitly. """
+
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Command(BaseCommand):
+    help = 'This fills an empty database with a large, made-up catalog for load tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=80000)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Random seed, so the same catalog can be made again.'
+        )
+
+    def handle(self, *args, **options):
+        book_count = options['books']
+        if book_count < 1:
+            raise CommandError('The number of books must be positive.')
+        if Book.objects.exists():
+            raise CommandError('The database already has books. Use an empty one.')
+
+        start_time = monotonic()
+        rng = Random(options['seed'])
+        pick_word = make_picker(rng, WORDS, get_zipf_weights(len(WORDS), 0.8))
+
+        with transaction.atomic():
+            self.stdout.write('Making people, subjects, and bookshelves...')
+            people = make_people(rng, int(book_count * PEOPLE_PER_BOOK))
+            Person.objects.bulk_create(people, batch_size=5000)
+            pick_person = make_picker(
+                rng, [person.id for person in people], get_zipf_weights(len(people))
+            )
+
+            subject_names = make_subject_names(rng, int(book_count * SUBJECTS_PER_BOOK))
+            rng.shuffle(subject_names)
+            Subject.objects.bulk_create(
+                [Subject(id=i + 1, name=name) for i, name in enumerate(subject_names)],
+                batch_size=5000
+            )
+            pick_subject = make_picker(
+                rng,
+                range(1, len(subject_names) + 1),
+                get_zipf_weights(len(subject_names), 0.9)
+            )
+
+            bookshelf_names = make_bookshelf_names(rng, BOOKSHELF_COUNT)
+            Bookshelf.objects.bulk_create(
+                [Bookshelf(id=i + 1, name=name) for i, name in enumerate(bookshelf_names)]
+            )
+            pick_bookshelf = make_picker(
+                rng,
+                range(1, len(bookshelf_names) + 1),
+                get_zipf_weights(len(bookshelf_names))
+            )
+
+            language_codes = list(LANGUAGE_WEIGHTS)
+            Language.objects.bulk_create(
+                [Language(id=i + 1, code=code) for i, code in enumerate(language_codes)]
+            )
+            pick_language = make_picker(
+                rng,
+                range(1, len(language_codes) + 1),
+                list(accumulate(LANGUAGE_WEIGHTS.values()))
+            )
+            MimeType.objects.bulk_create(
+                [MimeType(id=i + 1, name=name) for i, name in enumerate(MIME_TYPES)]
+            )
+            pick_media_type = make_picker(
+                rng,
+                list(MEDIA_TYPE_WEIGHTS),
+                list(accumulate(MEDIA_TYPE_WEIGHTS.values()))
+            )
+
+            for first_id in range(1, book_count + 1, BOOK_BATCH_SIZE):
+                last_id = min(first_id + BOOK_BATCH_SIZE - 1, book_count)
+                self.stdout.write(f'Making books {first_id} to {last_id}...')
+                self.make_books(
+                    rng,
+                    range(first_id, last_id + 1),
+                    pick_word,
+                    pick_person,
+                    pick_subject,
+                    pick_bookshelf,
+                    pick_language,
+                    pick_media_type
+                )
+
+            reset_sequences([Book, Bookshelf, Language, MimeType, Person, Subject])
+
+            self.stdout.write('Updating people...')
+            update_person_stats()
+            update_book_sort_keys()
+            update_book_author_years()
+            self.stdout.write('Finding related books...')
+            update_related_books()
+            update_trending_books()
+
+            CatalogVersion.objects.create(
+                book_count=Book.objects.count(),
+                books_processed=book_count,
+                duration=monotonic() - start_time,
+                facets=get_facet_counts(Book.objects.listed().values('id'))
+            )
+
+        self.stdout.write(
+            f'Made {book_count} books in {monotonic() - start_time:.1f} seconds.'
+        )
+
+    def make_books(
+        self,
+        rng,
+        ids,
+        pick_word,
+        pick_person,
+        pick_subject,
+        pick_bookshelf,
+        pick_language,
+        pick_media_type
+    ):
+        books = []
+        relations = {
+            Book.authors.through: [],
+            Book.bookshelves.through: [],
+            Book.editors.through: [],
+            Book.languages.through: [],
+            Book.subjects.through: [],
+            Book.translators.through: [],
+        }
+        formats = []
+        summaries = []
+
+        def relate(relation, field, values):
+            for value in set(values):
+                relations[relation].append(relation(book_id=id, **{field: value}))
+
+        for id in ids:
+            title = make_words(rng, pick_word, rng.randint(1, 7)).capitalize()
+            if rng.random() < 0.2:
+                title += ': ' + make_words(rng, pick_word, rng.randint(2, 6))
+            media_type = pick_media_type()
+
+            listed = rng.random() > 0.003
+            books.append(Book(
+                id=id,
+                gutenberg_id=id,
+                copyright=rng.choices([False, True, None], [97, 2, 1])[0],
+                download_count=int(rng.paretovariate(1.1) * 20) if listed else None,
+                media_type=media_type,
+                title=title if listed else None
+            ))
+
+            author_count = rng.choices([0, 1, 2, 3], [4, 86, 8, 2])[0]
+            relate(Book.authors.through, 'person_id', (pick_person() for _ in range(author_count)))
+            if rng.random() < 0.05:
+                relate(Book.editors.through, 'person_id', [pick_person()])
+            if rng.random() < 0.08:
+                relate(Book.translators.through, 'person_id', [pick_person()])
+
+            language_count = 2 if rng.random() < 0.02 else 1
+            relate(Book.languages.through, 'language_id', (pick_language() for _ in range(language_count)))
+
+            subject_count = min(int(rng.expovariate(1 / SUBJECTS_PER_LISTING)) + 1, 12)
+            relate(Book.subjects.through, 'subject_id', (pick_subject() for _ in range(subject_count)))
+            bookshelf_count = rng.choices([0, 1, 2, 3, 4], [20, 35, 25, 12, 8])[0]
+            relate(Book.bookshelves.through, 'bookshelf_id', (pick_bookshelf() for _ in range(bookshelf_count)))
+
+            for mime_type, url, chance in SOUND_FORMATS if media_type == 'Sound' else TEXT_FORMATS:
+                if rng.random() < chance:
+                    url_template, url_suffix = split_url(url % ((id,) * url.count('%d')), id)
+                    formats.append(Format(
+                        book_id=id,
+                        mime_type_id=MIME_TYPES.index(mime_type) + 1,
+                        url_template=url_template,
+                        url_suffix=url_suffix
+                    ))
+
+            if media_type == 'Text' and rng.random() < SUMMARY_CHANCE:
+                summaries.append(Summary(
+                    book_id=id,
+                    text=make_words(rng, pick_word, rng.randint(60, 160)).capitalize() + '.'
+                ))
+
+        Book.objects.bulk_create(books)
+        for relation, rows in relations.items():
+            relation.objects.bulk_create(rows, batch_size=5000)
+        Format.objects.bulk_create(formats, batch_size=5000)
+        Summary.objects.bulk_create(summaries, batch_size=5000)
@@ -0,0 +1,328 @@
+from http.client import HTTPConnection, HTTPSConnection
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
+from time import perf_counter
+from urllib.parse import urlsplit
+import json
+import socket
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_PATHS = [
+    '/books/',
+    '/books/?page=20',
+    '/books/?languages=en',
+    '/books/?search=great',
+    '/books/?topic=fiction',
+    '/books/1/',
+]
+
+# These are the kinds of book list queries compared by `--matrix`, each with
+# a few variants so that cached responses don't make them all alike. Search
+# and topic words are common in real catalogs and in `generatecatalog` ones.
+QUERY_SHAPES = {
+    'default_page': ['/books/'],
+    'deep_page': ['/books/?page=500', '/books/?page=900', '/books/?page=1300'],
+    'search_1_term': [
+        '/books/?search=history',
+        '/books/?search=love',
+        '/books/?search=voyage',
+    ],
+    'search_3_terms': [
+        '/books/?search=great%20war%20stories',
+        '/books/?search=old%20king%20letters',
+        '/books/?search=new%20world%20travels',
+    ],
+    'search_8_terms': [
+        '/books/?search=the%20great%20history%20of%20love%20and%20war%20in%20england',
+        '/books/?search=old%20stories%20of%20the%20sea%20and%20ships%20captain%20journey',
+    ],
+    'topic': ['/books/?topic=fiction', '/books/?topic=children', '/books/?topic=travel'],
+    'languages': ['/books/?languages=fr', '/books/?languages=de,es', '/books/?languages=en'],
+    'mime_type': [
+        '/books/?mime_type=audio',
+        '/books/?mime_type=application%2Fepub',
+        '/books/?mime_type=text%2Fplain',
+    ],
+    'author_years': [
+        '/books/?author_year_start=1800&author_year_end=1899',
+        '/books/?author_year_end=1600',
+        '/books/?author_year_start=1900',
+    ],
+    'ids': [
+        '/books/?ids=' + ','.join(str(id) for id in range(1, 33)),
+        '/books/?ids=' + ','.join(str(id) for id in range(1000, 32000, 1000)),
+    ],
+}
+
+
+def get_percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+def to_milliseconds(seconds):
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 2)
+
+
+def parse_header(value):
+    """
+    This splits a `Name: value` header from the command line, as curl
+    takes them.
+    """
+
+    name, separator, header_value = value.partition(':')
+    if not separator or not name.strip():
+        raise CommandError('Headers must look like "Name: value", not %r.' % value)
+    return name.strip(), header_value.strip()
+
+
+def hold_slow_client(url, stop_event, timeout):
+    """
+    This imitates a slow client by sending a request's headers one by one,
+    a second apart, until `stop_event` is set.
+    """
+
+    host, _, port = url.netloc.partition(':')
+    try:
+        client = socket.create_connection((host, int(port or 80)), timeout=timeout)
+        client.sendall(b'GET /books/ HTTP/1.1\r\nHost: ' + host.encode() + b'\r\n')
+        while not stop_event.wait(1):
+            client.sendall(b'X-Slow: 1\r\n')
+    except OSError:
+        pass
+    else:
+        client.close()
+
+
+def run_load(
+    base_url,
+    paths,
+    concurrency,
+    request_count,
+    headers=None,
+    slow_clients=0,
+    timeout=60
+):
+    """
+    This requests the given paths in turn from `concurrency` threads, each
+    with its own keep-alive connection, until `request_count` requests have
+    been sent. Meanwhile, `slow_clients` other connections are kept busy
+    with requests that are never finished. It gives a dictionary of
+    throughput and latency statistics.
+    """
+
+    url = urlsplit(base_url)
+    connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+    headers = headers or {}
+
+    latencies = []
+    errors = []
+    lock = Lock()
+    next_index = [0]
+
+    def work():
+        connection = connection_class(url.netloc, timeout=timeout)
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= request_count:
+                    break
+                next_index[0] += 1
+            path = url.path.rstrip('/') + paths[index % len(paths)]
+
+            start = perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except Exception as error:
+                connection.close()
+                connection = connection_class(url.netloc, timeout=timeout)
+                status = str(error)
+            latency = perf_counter() - start
+
+            with lock:
+                if status == 200:
+                    latencies.append(latency)
+                else:
+                    errors.append(status)
+        connection.close()
+
+    stop_event = Event()
+    slow_threads = [
+        Thread(target=hold_slow_client, args=(url, stop_event, timeout))
+        for _ in range(slow_clients)
+    ]
+    for thread in slow_threads:
+        thread.start()
+
+    threads = [Thread(target=work) for _ in range(concurrency)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = perf_counter() - start
+
+    stop_event.set()
+    for thread in slow_threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'slow_clients': slow_clients,
+        'requests': request_count,
+        'errors': len(errors),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 1),
+        'latency_ms': {
+            'p50': to_milliseconds(get_percentile(latencies, 50)),
+            'p90': to_milliseconds(get_percentile(latencies, 90)),
+            'p95': to_milliseconds(get_percentile(latencies, 95)),
+            'p99': to_milliseconds(get_percentile(latencies, 99)),
+            'max': to_milliseconds(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def compare_reports(old_report, new_report):
+    """
+    This gives the ratio of each query shape's new throughput and latency
+    percentiles to the old report's, where both reports have the shape.
+    """
+
+    comparison = {}
+    for shape, new_result in new_report['shapes'].items():
+        old_result = old_report.get('shapes', {}).get(shape)
+        if not old_result:
+            continue
+        ratios = {}
+        if old_result['throughput_rps']:
+            ratios['throughput_rps'] = round(
+                new_result['throughput_rps'] / old_result['throughput_rps'], 2
+            )
+        for percentile, new_ms in new_result['latency_ms'].items():
+            old_ms = old_result['latency_ms'].get(percentile)
+            if old_ms and new_ms is not None:
+                ratios['latency_' + percentile] = round(new_ms / old_ms, 2)
+        comparison[shape] = ratios
+    return comparison
+
+
+class Command(BaseCommand):
+    help = 'This measures API throughput and latency against a running server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--header',
+            action='append',
+            default=[],
+            dest='headers',
+            help='A "Name: value" header to send with each request. Repeatable.'
+        )
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=0,
+            help='Number of connections to hold open with unfinished requests.'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Seconds to wait for each response before counting an error.'
+        )
+        parser.add_argument(
+            '--matrix',
+            action='store_true',
+            help='Run each query shape separately instead of the given paths.'
+        )
+        parser.add_argument(
+            '--shape',
+            action='append',
+            choices=sorted(QUERY_SHAPES),
+            dest='shapes',
+            help='A query shape for --matrix to run, instead of all of them.'
+        )
+        parser.add_argument('--output', help='File to write the JSON report to.')
+        parser.add_argument(
+            '--compare',
+            help='Earlier report file to compare a --matrix run with.'
+        )
+        parser.add_argument(
+            '--warm-up',
+            type=int,
+            default=0,
+            help='Number of untimed requests to send first.'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('Concurrency and requests must be positive.')
+        headers = dict(parse_header(header) for header in options['headers'])
+
+        if options['matrix']:
+            shapes = {
+                name: QUERY_SHAPES[name]
+                for name in options['shapes'] or QUERY_SHAPES
+            }
+        else:
+            shapes = {'paths': options['paths']}
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'base_url': options['base_url'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'shapes': {},
+        }
+        for name, paths in shapes.items():
+            if options['warm_up']:
+                run_load(
+                    options['base_url'],
+                    paths,
+                    options['concurrency'],
+                    options['warm_up'],
+                    headers=headers,
+                    timeout=options['timeout']
+                )
+
+            result = run_load(
+                options['base_url'],
+                paths,
+                options['concurrency'],
+                options['requests'],
+                headers=headers,
+                slow_clients=options['slow_clients'],
+                timeout=options['timeout']
+            )
+            report['shapes'][name] = result
+            if options['matrix']:
+                self.stderr.write('%s: %s requests/s, p99 %s ms' % (
+                    name, result['throughput_rps'], result['latency_ms']['p99']
+                ))
+
+        if options['compare']:
+            with open(options['compare']) as report_file:
+                report['comparison'] = compare_reports(json.load(report_file), report)
+
+        report_json = json.dumps(report, indent=4)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(report_json + '\n')
+        if not options['matrix']:
+            self.stdout.write(json.dumps(report['shapes']['paths'], indent=4))
+        elif not options['output']:
+            self.stdout.write(report_json)
@@ -0,0 +1,30 @@
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from books.snapshots import publish_snapshot
+
+
+class Command(BaseCommand):
+    help = 'This publishes a snapshot of the catalog database for replicas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            default=settings.SNAPSHOT_DIR,
+            help='The snapshot directory, SNAPSHOT_DIR by default.'
+        )
+
+    def handle(self, *args, **options):
+        if settings.DATABASE_ENGINE != 'sqlite':
+            raise CommandError('Snapshots can only be made of SQLite databases.')
+        if not options['dir']:
+            raise CommandError('No snapshot directory was given.')
+
+        start_time = monotonic()
+        manifest = publish_snapshot(options['dir'])
+        self.stdout.write(
+            f'Published {manifest["file"]} ({manifest["size"]} bytes) '
+            f'in {monotonic() - start_time:.1f} seconds.'
+        )
@@ -5,15 +5,23 @@ import platform
 import shutil
 import tarfile
 import zipfile
-from time import strftime, sleep
+from time import monotonic, strftime, sleep
 import sys
 
 from django.conf import settings
 from django.core.mail import send_mail
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
 
-from books import utils
+from books import postgres, utils
+from books.facets import get_facet_counts
 from books.models import *
+from books.related import update_related_books
+from books.snapshots import publish_snapshot
+from books.storage import compress_text, split_url
+from books.trending import update_trending_books
 
 
 TEMP_PATH = settings.CATALOG_TEMP_DIR
@@ -211,6 +219,12 @@ def copy_directory(src, dst):
 
 
 def put_catalog_in_db():
+    """
+    This puts the catalog files' books in the database. It gives how many
+    there were, and a dictionary of the change to each created or updated
+    book, by Project Gutenberg ID.
+    """
+
     book_ids = []
     log('    Scanning catalog directories...')
     for directory_item in os.listdir(settings.CATALOG_RDF_DIR):
@@ -229,39 +243,42 @@ def put_catalog_in_db():
     total_books = len(book_directories)
     log(f'    Found {total_books} books to process...')
 
-    processed = 0
-    for directory in book_directories:
-        id = int(directory)
-        processed += 1
+    books = read_catalog_books(book_directories)
 
-        # Log progress every 1000 books or at specific milestones
-        if processed % 1000 == 0 or processed == total_books:
-            percent = int(processed * 100 / total_books)
-            log(f'    Processing books: {processed}/{total_books} ({percent}%)')
+    if connection.vendor == 'postgresql':
+        log('    Bulk loading books with COPY...')
+        changes = postgres.put_books_in_db(books)
+        return total_books, changes
 
-        book_path = os.path.join(
-            settings.CATALOG_RDF_DIR,
-            directory,
-            'pg' + directory + '.rdf'
-        )
+    changes = {}
+
+    # There are only a few MIME types, so they are looked up once each.
+    mime_types = {}
 
-        book = utils.get_book(id, book_path)
+    for book in books:
+        id = book['id']
 
         try:
             '''Make/update the book.'''
 
             book_in_db = Book.objects.filter(gutenberg_id=id)
+            content_hash = utils.get_content_hash(book)
 
             if book_in_db.exists():
                 book_in_db = book_in_db[0]
+                if book_in_db.content_hash != content_hash:
+                    changes[id] = CatalogChange.UPDATED
+                book_in_db.content_hash = content_hash
                 book_in_db.copyright = book['copyright']
                 book_in_db.download_count = book['downloads']
                 book_in_db.media_type = book['type']
                 book_in_db.title = book['title']
                 book_in_db.save()
             else:
+                changes[id] = CatalogChange.CREATED
                 book_in_db = Book.objects.create(
                     gutenberg_id=id,
+                    content_hash=content_hash,
                     copyright=book['copyright'],
                     download_count=book['downloads'],
                     media_type=book['type'],
@@ -322,18 +339,27 @@ def put_catalog_in_db():
 
             format_ids = []
             for format_ in book['formats']:
+                mime_type_in_db = mime_types.get(format_)
+                if mime_type_in_db is None:
+                    mime_type_in_db, _ = MimeType.objects.get_or_create(name=format_)
+                    mime_types[format_] = mime_type_in_db
+                url_template, url_suffix = split_url(
+                    book['formats'][format_], id
+                )
                 format_in_db = Format.objects.filter(
                     book=book_in_db,
-                    mime_type=format_,
-                    url=book['formats'][format_]
+                    mime_type=mime_type_in_db,
+                    url_template=url_template,
+                    url_suffix=url_suffix
                 )
                 if format_in_db.exists():
                     format_in_db = format_in_db[0]
                 else:
                     format_in_db = Format.objects.create(
                         book=book_in_db,
-                        mime_type=format_,
-                        url=book['formats'][format_]
+                        mime_type=mime_type_in_db,
+                        url_template=url_template,
+                        url_suffix=url_suffix
                     )
                 format_ids.append(format_in_db.id)
 
@@ -377,7 +403,9 @@ def put_catalog_in_db():
 
             summary_ids = []
             for summary in book['summaries']:
-                summary_in_db = Summary.objects.filter(book=book_in_db, text=summary)
+                summary_in_db = Summary.objects.filter(
+                    book=book_in_db, data=compress_text(summary)
+                )
                 if summary_in_db.exists():
                     summary_in_db = summary_in_db[0]
                 else:
@@ -399,6 +427,32 @@ def put_catalog_in_db():
             )
             raise error
 
+    return total_books, changes
+
+
+def read_catalog_books(book_directories):
+    """ This parses each book's RDF file, logging progress as it goes. """
+
+    total_books = len(book_directories)
+
+    processed = 0
+    for directory in book_directories:
+        id = int(directory)
+        processed += 1
+
+        # Log progress every 1000 books or at specific milestones
+        if processed % 1000 == 0 or processed == total_books:
+            percent = int(processed * 100 / total_books)
+            log(f'    Processing books: {processed}/{total_books} ({percent}%)')
+
+        book_path = os.path.join(
+            settings.CATALOG_RDF_DIR,
+            directory,
+            'pg' + directory + '.rdf'
+        )
+
+        yield utils.get_book(id, book_path)
+
 
 def get_or_create_person(data):
     person = Person.objects.filter(
@@ -419,6 +473,138 @@ def get_or_create_person(data):
     return person
 
 
+def update_person_stats():
+    """
+    This fills in new people's sort names and recounts everyone's listed
+    books, with one UPDATE statement for each kind of count.
+    """
+
+    people = list(Person.objects.filter(sort_name=''))
+    for person in people:
+        person.sort_name = utils.normalize(person.name)[:128]
+    Person.objects.bulk_update(people, ['sort_name'], batch_size=1000)
+
+    for count_field, relation in [
+        ('authored_count', Book.authors),
+        ('edited_count', Book.editors),
+        ('translated_count', Book.translators),
+    ]:
+        counts = relation.through.objects.filter(
+            book__download_count__isnull=False,
+            book__title__isnull=False,
+            person_id=OuterRef('pk')
+        ).order_by().values('person_id').annotate(count=Count('*')).values('count')
+        Person.objects.update(**{count_field: Coalesce(Subquery(counts), 0)})
+
+
+def update_book_sort_keys():
+    """
+    This works out the keys that books are sorted by title and by author
+    with, saving only the ones that changed. Author keys are people's sort
+    names, so this runs after `update_person_stats`.
+    """
+
+    language_codes = {}
+    for book_id, code in Book.languages.through.objects.values_list(
+        'book_id', 'language__code'
+    ):
+        language_codes.setdefault(book_id, []).append(code)
+
+    books = []
+    for book in Book.objects.only('title', 'title_sort').iterator():
+        title_sort = utils.get_title_sort_key(
+            book.title, language_codes.get(book.id, ())
+        )
+        if title_sort != book.title_sort:
+            book.title_sort = title_sort
+            books.append(book)
+    Book.objects.bulk_update(books, ['title_sort'], batch_size=1000)
+
+    first_author_names = Book.authors.through.objects.filter(
+        book_id=OuterRef('pk')
+    ).order_by('id').values('person__sort_name')[:1]
+    Book.objects.annotate(
+        new_author_sort=Coalesce(Subquery(first_author_names), Value(''))
+    ).exclude(author_sort=F('new_author_sort')).update(
+        author_sort=F('new_author_sort')
+    )
+
+
+def get_author_year_range():
+    """
+    This gives expressions for the earliest and latest of the years in
+    which a book's authors were born or died, which are null for books
+    with no such years.
+    """
+
+    book_authors = Book.authors.through.objects.filter(
+        book_id=OuterRef('pk')
+    ).values('book_id')
+
+    def get_years(aggregate):
+        birth_year = Subquery(
+            book_authors.annotate(year=aggregate('person__birth_year')).values('year')
+        )
+        death_year = Subquery(
+            book_authors.annotate(year=aggregate('person__death_year')).values('year')
+        )
+        # Either year may be null, and SQLite's LEAST and GREATEST are null
+        # if any of their arguments are.
+        return Coalesce(birth_year, death_year), Coalesce(death_year, birth_year)
+
+    return Least(*get_years(Min)), Greatest(*get_years(Max))
+
+
+def update_book_author_years():
+    """
+    This works out the range of each book's author years, which filtering
+    by `author_year_start` and `author_year_end` uses, saving only the
+    ones that changed.
+    """
+
+    year_min, year_max = get_author_year_range()
+    Book.objects.annotate(
+        new_author_year_min=year_min,
+        new_author_year_max=year_max
+    ).filter(
+        # Comparisons with null are never true, so ranges that became null
+        # or stopped being null are looked for on their own. The earliest
+        # and latest years are only ever null together.
+        Q(author_year_min__isnull=True, new_author_year_min__isnull=False) |
+        Q(author_year_min__isnull=False, new_author_year_min__isnull=True) |
+        Q(author_year_min__lt=F('new_author_year_min')) |
+        Q(author_year_min__gt=F('new_author_year_min')) |
+        Q(author_year_max__lt=F('new_author_year_max')) |
+        Q(author_year_max__gt=F('new_author_year_max'))
+    ).update(
+        author_year_min=F('new_author_year_min'),
+        author_year_max=F('new_author_year_max')
+    )
+
+
+def record_catalog_version(books_processed, changes, duration):
+    """
+    This records a new catalog version with the changes it made, given as a
+    dictionary of changes by Project Gutenberg ID, and gives the version.
+    """
+
+    with transaction.atomic():
+        catalog_version = CatalogVersion.objects.create(
+            book_count=Book.objects.count(),
+            books_processed=books_processed,
+            duration=duration,
+            facets=get_facet_counts(Book.objects.listed().values('id'))
+        )
+        CatalogChange.objects.bulk_create(
+            [
+                CatalogChange(change=change, gutenberg_id=book_id, version=catalog_version)
+                for book_id, change in sorted(changes.items())
+            ],
+            batch_size=5000
+        )
+    return catalog_version
+
+
 def send_log_email():
     if not (settings.ADMIN_EMAILS or settings.EMAIL_HOST_ADDRESS):
         return
@@ -467,6 +653,7 @@ class Command(BaseCommand):
     help = 'This replaces the catalog files with the latest ones.'
 
     def handle(self, *args, **options):
+        start_time = monotonic()
         try:
             date_and_time = strftime('%H:%M:%S on %B %d, %Y')
             log('Starting script at', date_and_time)
@@ -583,6 +770,7 @@ class Command(BaseCommand):
             log(f'    Found {len(stale_directory_set)} stale directories to remove')
 
             log('  Removing stale directories and books...')
+            deleted_ids = []
             for directory in stale_directory_set:
                 try:
                     book_id = int(directory)
@@ -590,6 +778,8 @@ class Command(BaseCommand):
                     # Ignore the directory if its name isn't a book ID number.
                     continue
                 book = Book.objects.filter(gutenberg_id=book_id)
+                if book.exists():
+                    deleted_ids.append(book_id)
                 book.delete()
                 path = os.path.join(MOVE_TARGET_PATH, directory)
                 shutil.rmtree(path)
@@ -616,7 +806,36 @@ class Command(BaseCommand):
             log('  File copy complete!')
 
             log('  Putting the catalog in the database...')
-            put_catalog_in_db()
+            books_processed, changes = put_catalog_in_db()
+            for book_id in deleted_ids:
+                changes[book_id] = CatalogChange.DELETED
+
+            log('  Updating people...')
+            update_person_stats()
+
+            log('  Updating sort keys...')
+            update_book_sort_keys()
+
+            log('  Updating author years...')
+            update_book_author_years()
+
+            log('  Finding related books...')
+            update_related_books()
+
+            log('  Finding trending books...')
+            update_trending_books()
+
+            log('  Recording the catalog version...')
+            catalog_version = record_catalog_version(
+                books_processed, changes, monotonic() - start_time
+            )
+            log(f'    Catalog version: {catalog_version.id}')
+            log(f'    Books created, updated, or deleted: {len(changes)}')
+
+            if settings.SNAPSHOT_MODE == 'publish':
+                log('  Publishing a snapshot for replicas...')
+                manifest = publish_snapshot()
+                log(f'    Snapshot: {manifest["file"]} ({manifest["size"]} bytes)')
 
             log('  Removing temporary files...')
             shutil.rmtree(TEMP_PATH)
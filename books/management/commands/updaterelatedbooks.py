@@ -0,0 +1,16 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+
+from books.related import update_related_books
+
+
+class Command(BaseCommand):
+    help = 'This works out every listed book\'s related books again.'
+
+    def handle(self, *args, **options):
+        start_time = monotonic()
+        related_count = update_related_books()
+        self.stdout.write(
+            f'Stored {related_count} related books in {monotonic() - start_time:.1f} seconds.'
+        )
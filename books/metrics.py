@@ -0,0 +1,209 @@
+"""
+This records Prometheus metrics of API requests and serves them, with the
+state of the catalog, at /metrics. When PROMETHEUS_MULTIPROC_DIR is set,
+as it is for gunicorn, each worker process writes its metrics to files in
+that directory and they are added together when served.
+"""
+
+from contextvars import ContextVar
+from time import perf_counter, time
+import os
+
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .facets import FILTER_PARAMETERS
+from .models import CatalogVersion
+
+
+REQUEST_DURATION = Histogram(
+    'gutendex_request_duration_seconds',
+    'Time taken to handle requests.',
+    ['endpoint', 'method', 'status'],
+)
+FILTER_REQUEST_DURATION = Histogram(
+    'gutendex_filter_request_duration_seconds',
+    'Time taken to handle book lists, by filter parameter used.',
+    ['parameter'],
+)
+REQUEST_QUERIES = Histogram(
+    'gutendex_request_queries',
+    'SQL queries run for each request.',
+    ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_QUERY_DURATION = Histogram(
+    'gutendex_request_query_duration_seconds',
+    'Time spent running SQL queries for each request.',
+    ['endpoint'],
+)
+RESPONSE_SIZE = Histogram(
+    'gutendex_response_size_bytes',
+    'Sizes of response bodies, after any compression.',
+    ['endpoint'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+CACHE_LOOKUPS = Counter(
+    'gutendex_cache_lookups_total',
+    'Cache lookups, by cache and whether they were hits or misses.',
+    ['cache', 'result'],
+)
+
+APP_METRICS = (
+    REQUEST_DURATION,
+    FILTER_REQUEST_DURATION,
+    REQUEST_QUERIES,
+    REQUEST_QUERY_DURATION,
+    RESPONSE_SIZE,
+    CACHE_LOOKUPS,
+)
+
+# This holds the query statistics of the request being handled. Context
+# variables are copied into the threads that run async views' queries.
+_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+
+def record_cache_lookup(cache_name, hit):
+    CACHE_LOOKUPS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query_count += 1
+        stats.query_seconds += perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """ This times the queries of each new database connection. """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def record_request(request, response, duration, stats):
+    match = request.resolver_match
+    endpoint = match.url_name if match and match.url_name else 'other'
+
+    REQUEST_DURATION.labels(
+        endpoint, request.method, '%dxx' % (response.status_code // 100)
+    ).observe(duration)
+
+    if endpoint == 'book-list':
+        parameters = [
+            parameter for parameter in FILTER_PARAMETERS
+            if parameter in request.GET
+        ]
+        for parameter in parameters or ['none']:
+            FILTER_REQUEST_DURATION.labels(parameter).observe(duration)
+
+    REQUEST_QUERIES.labels(endpoint).observe(stats.query_count)
+    REQUEST_QUERY_DURATION.labels(endpoint).observe(stats.query_seconds)
+
+    if not response.streaming:
+        RESPONSE_SIZE.labels(endpoint).observe(len(response.content))
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """ This records the metrics of each request. """
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = RequestStats()
+            token = _request_stats.set(stats)
+            start = perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _request_stats.reset(token)
+            record_request(request, response, perf_counter() - start, stats)
+            return response
+    else:
+        def middleware(request):
+            stats = RequestStats()
+            token = _request_stats.set(stats)
+            start = perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _request_stats.reset(token)
+            record_request(request, response, perf_counter() - start, stats)
+            return response
+
+    return middleware
+
+
+class CatalogCollector:
+    """ This reads gauges of the latest catalog update when metrics are served. """
+
+    def collect(self):
+        catalog_version = CatalogVersion.objects.order_by('-id').first()
+        if catalog_version is None:
+            return
+
+        gauges = [
+            (
+                'gutendex_catalog_version',
+                'ID of the latest catalog version.',
+                catalog_version.id,
+            ),
+            (
+                'gutendex_catalog_age_seconds',
+                'Time since the latest catalog update finished.',
+                time() - catalog_version.created.timestamp(),
+            ),
+            (
+                'gutendex_catalog_books',
+                'Books in the database after the latest catalog update.',
+                catalog_version.book_count,
+            ),
+            (
+                'gutendex_catalog_books_processed',
+                'Books read from catalog files in the latest catalog update.',
+                catalog_version.books_processed,
+            ),
+        ]
+        if catalog_version.duration is not None:
+            gauges.append((
+                'gutendex_catalog_update_duration_seconds',
+                'Time taken by the latest catalog update.',
+                catalog_version.duration,
+            ))
+
+        for name, documentation, value in gauges:
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+def metrics(request):
+    registry = CollectorRegistry()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        for metric in APP_METRICS:
+            registry.register(metric)
+    registry.register(CatalogCollector())
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,189 @@
+import hashlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .catalog import get_catalog_version
+from .executors import async_view_executor
+from .metrics import record_cache_lookup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESSED_LENGTH = 512
+
+BROTLI_QUALITY = 9
+# This is how long (in seconds) compressed bodies stay in the cache. They
+# also expire whenever the catalog version changes.
+COMPRESSED_BODY_TIMEOUT = 24 * 60 * 60
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return compress_string(body)
+
+
+def get_accepted_encodings(accept_encoding):
+    """
+    This gives the supported content codings in an `Accept-Encoding` header,
+    preferring those with higher quality values and then Brotli over gzip.
+
+    >>> get_accepted_encodings('gzip, deflate, br;q=0.9')
+    ['gzip', 'br']
+    """
+
+    supported_encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, parameters = item.partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        parameter_name, _, value = parameters.partition('=')
+        if parameter_name.strip().lower() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding == '*':
+            for encoding in supported_encodings:
+                qualities.setdefault(encoding, quality)
+        elif coding in supported_encodings:
+            qualities[coding] = quality
+
+    encodings = [
+        encoding for encoding in supported_encodings
+        if qualities.get(encoding, 0) > 0
+    ]
+    encodings.sort(key=lambda encoding: -qualities[encoding])
+    return encodings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    This compresses JSON API responses with Brotli or gzip, whichever the
+    client prefers. Compressed bodies are cached by the digest of the
+    uncompressed body and the catalog version, so each popular page is
+    compressed once per catalog update rather than on every request.
+
+    In async mode, responses are compressed in the async views' thread pool,
+    so that one slow body doesn't hold up every other request's response.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            self.process_response_in_pool = sync_to_async(
+                self.run_process_response,
+                thread_sensitive=False,
+                executor=async_view_executor
+            )
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return await self.process_response_in_pool(request, response)
+
+    def run_process_response(self, request, response):
+        # Pool threads have their own connections, for the catalog version.
+        try:
+            return self.process_response(request, response)
+        finally:
+            close_old_connections()
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.status_code != 200
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if len(response.content) < MIN_COMPRESSED_LENGTH:
+            return response
+
+        encodings = get_accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if not encodings:
+            return response
+        encoding = encodings[0]
+
+        if 'no-store' in response.get('Cache-Control', ''):
+            # Bodies that are different every time aren't worth caching.
+            compressed_body = compress_body(response.content, encoding)
+        else:
+            compressed_body = self.get_compressed_body(response.content, encoding)
+
+        if len(compressed_body) >= len(response.content):
+            return response
+
+        response.content = compressed_body
+        response['Content-Length'] = str(len(compressed_body))
+        response['Content-Encoding'] = encoding
+
+        # This keeps ETags weak, as Django's `GZipMiddleware` does, since the
+        # body has changed.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
+
+    def get_compressed_body(self, body, encoding):
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        cache_key = 'compressed-body:%s:%s' % (encoding, digest)
+        version = get_catalog_version()
+
+        compressed_body = cache.get(cache_key, version=version)
+        record_cache_lookup('compressed-body', compressed_body is not None)
+        if compressed_body is None:
+            compressed_body = compress_body(body, encoding)
+            cache.set(
+                cache_key,
+                compressed_body,
+                COMPRESSED_BODY_TIMEOUT,
+                version=version
+            )
+        return compressed_body
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    This is WhiteNoise's middleware, which also works in async mode so that
+    ASGI requests don't have to pass through a single synchronous thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-19 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='facets',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.27 on 2026-10-19 10:30
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# This is a copy of `books.utils.normalize` as it was when sort names were
+# added, so that later changes there can't change what this migration
+# writes.
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    text = text.casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return NON_WORD_PATTERN.sub(' ', text).strip()
+
+
+def fill_person_stats(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Person = apps.get_model('books', 'Person')
+
+    people = list(Person.objects.only('name'))
+    for person in people:
+        person.sort_name = normalize(person.name)[:128]
+    Person.objects.bulk_update(people, ['sort_name'], batch_size=1000)
+
+    for count_field, relation in [
+        ('authored_count', Book.authors),
+        ('edited_count', Book.editors),
+        ('translated_count', Book.translators),
+    ]:
+        counts = relation.through.objects.filter(
+            book__download_count__isnull=False,
+            book__title__isnull=False,
+            person_id=OuterRef('pk')
+        ).order_by().values('person_id').annotate(count=Count('*')).values('count')
+        Person.objects.update(**{count_field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_catalogversion_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='authored_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='edited_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='sort_name',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='translated_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['sort_name', 'id'], name='books_perso_sort_na_b4860e_idx'),
+        ),
+        migrations.RunPython(fill_person_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-19 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_person_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='books_processed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='catalogversion',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.27 on 2026-10-19 10:55
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# These are copies of `books.utils` as it was when sort keys were added, so
+# that later changes there can't change what this migration writes.
+LEADING_ARTICLES = {
+    'de': {'das', 'der', 'die', 'ein', 'eine'},
+    'en': {'a', 'an', 'the'},
+    'es': {'el', 'la', 'las', 'los', 'un', 'una'},
+    'fr': {'l', 'la', 'le', 'les', 'un', 'une'},
+    'it': {'gli', 'i', 'il', 'l', 'la', 'le', 'lo', 'un', 'una', 'uno'},
+    'nl': {'de', 'een', 'het'},
+    'pt': {'a', 'as', 'o', 'os', 'um', 'uma'},
+}
+TITLE_SORT_KEY_LENGTH = 255
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    text = text.casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return NON_WORD_PATTERN.sub(' ', text).strip()
+
+
+def get_title_sort_key(title, language_codes):
+    key = normalize(title or '')
+    first_word, _, rest = key.partition(' ')
+    if rest and any(
+        first_word in LEADING_ARTICLES.get(code, ()) for code in language_codes
+    ):
+        key = rest
+    return key[:TITLE_SORT_KEY_LENGTH]
+
+
+def fill_sort_keys(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+
+    language_codes = {}
+    for book_id, code in Book.languages.through.objects.values_list(
+        'book_id', 'language__code'
+    ):
+        language_codes.setdefault(book_id, []).append(code)
+
+    books = list(Book.objects.only('title'))
+    for book in books:
+        book.title_sort = get_title_sort_key(book.title, language_codes.get(book.id, ()))
+    Book.objects.bulk_update(books, ['title_sort'], batch_size=1000)
+
+    first_author_names = Book.authors.through.objects.filter(
+        book_id=OuterRef('pk')
+    ).order_by('id').values('person__sort_name')[:1]
+    Book.objects.update(
+        author_sort=Coalesce(Subquery(first_author_names), Value(''))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_catalogversion_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='author_sort',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='title_sort',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_sort_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_sort', 'title_sort', 'id'], name='books_book_author__526554_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title_sort', 'id'], name='books_book_title_s_f33575_idx'),
+        ),
+    ]
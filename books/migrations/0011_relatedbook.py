@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-19 10:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_book_sort_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedBook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_books', to='books.book')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='books.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='relatedbook',
+            constraint=models.UniqueConstraint(fields=('book', 'rank'), name='unique_related_book_rank'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.27 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_relatedbook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MimeType',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='format',
+            old_name='mime_type',
+            new_name='mime_type_name',
+        ),
+        migrations.AddField(
+            model_name='format',
+            name='mime_type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='books.mimetype'),
+        ),
+        migrations.AddField(
+            model_name='format',
+            name='url_template',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='format',
+            name='url_suffix',
+            field=models.CharField(default='', max_length=256),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='data',
+            field=models.BinaryField(default=b''),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 4.2.27 on 2026-10-19 12:41
+
+import zlib
+
+from django.db import migrations
+
+
+BATCH_SIZE = 5000
+
+# These are copies of `books.storage` as it was when formats and summaries
+# were first packed, so that later changes there can't change what this
+# migration writes.
+URL_TEMPLATES = (
+    '',
+    'https://www.gutenberg.org/ebooks/{id}',
+    'https://www.gutenberg.org/cache/epub/{id}/pg{id}',
+    'https://www.gutenberg.org/files/{id}/{id}',
+    'https://www.gutenberg.org/files/{id}/',
+)
+
+SUMMARY_COMPRESSION_LEVEL = 9
+
+
+def split_url(url, gutenberg_id):
+    best_template = 0
+    best_prefix = ''
+    for template, pattern in enumerate(URL_TEMPLATES):
+        prefix = pattern.replace('{id}', str(gutenberg_id))
+        if len(prefix) > len(best_prefix) and url.startswith(prefix):
+            best_template = template
+            best_prefix = prefix
+    return best_template, url[len(best_prefix):]
+
+
+def join_url(template, suffix, gutenberg_id):
+    return URL_TEMPLATES[template].replace('{id}', str(gutenberg_id)) + suffix
+
+
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), SUMMARY_COMPRESSION_LEVEL)
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def update_rows(schema_editor, model, fields, rows):
+    """
+    This sets `fields` of many rows, given as tuples of their values and
+    then their ID, with one statement run over and over, which is much
+    faster than `bulk_update` for every row of a large table.
+    """
+
+    quote_name = schema_editor.quote_name
+    sql = 'UPDATE %s SET %s WHERE id = %%s' % (
+        quote_name(model._meta.db_table),
+        ', '.join('%s = %%s' % quote_name(model._meta.get_field(field).column) for field in fields)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        cursor.executemany(sql, batch)
+
+
+def pack_formats_and_summaries(apps, schema_editor):
+    Format = apps.get_model('books', 'Format')
+    MimeType = apps.get_model('books', 'MimeType')
+    Summary = apps.get_model('books', 'Summary')
+
+    for name in Format.objects.values_list('mime_type_name', flat=True).distinct():
+        mime_type, _ = MimeType.objects.get_or_create(name=name)
+        Format.objects.filter(mime_type_name=name).update(mime_type=mime_type)
+
+    update_rows(schema_editor, Format, ('url_template', 'url_suffix'), (
+        (*split_url(url, gutenberg_id), id)
+        for id, url, gutenberg_id in Format.objects.values_list(
+            'id', 'url', 'book__gutenberg_id'
+        ).iterator(chunk_size=BATCH_SIZE)
+    ))
+    update_rows(schema_editor, Summary, ('data',), (
+        (compress_text(text), id)
+        for id, text in Summary.objects.values_list('id', 'text').iterator(
+            chunk_size=BATCH_SIZE
+        )
+    ))
+
+
+def unpack_formats_and_summaries(apps, schema_editor):
+    Format = apps.get_model('books', 'Format')
+    Summary = apps.get_model('books', 'Summary')
+
+    update_rows(schema_editor, Format, ('mime_type_name', 'url'), (
+        (mime_type_name, join_url(url_template, url_suffix, gutenberg_id), id)
+        for id, mime_type_name, url_template, url_suffix, gutenberg_id
+        in Format.objects.values_list(
+            'id', 'mime_type__name', 'url_template', 'url_suffix', 'book__gutenberg_id'
+        ).iterator(chunk_size=BATCH_SIZE)
+    ))
+    update_rows(schema_editor, Summary, ('text',), (
+        (decompress_text(data), id)
+        for id, data in Summary.objects.values_list('id', 'data').iterator(
+            chunk_size=BATCH_SIZE
+        )
+    ))
+
+
+# The new fields are filled in by a migration of their own, as PostgreSQL
+# can't alter tables in a transaction that has just updated them.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_compact_formats_summaries'),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_formats_and_summaries, unpack_formats_and_summaries),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.27 on 2026-10-19 12:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_pack_formats_summaries'),
+    ]
+
+    operations = [
+        # These let the removed columns be added back empty before they are
+        # filled in, when unapplying.
+        migrations.AlterField(
+            model_name='format',
+            name='mime_type_name',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='format',
+            name='url',
+            field=models.CharField(blank=True, max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='summary',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RemoveField(
+            model_name='format',
+            name='mime_type_name',
+        ),
+        migrations.RemoveField(
+            model_name='format',
+            name='url',
+        ),
+        migrations.RemoveField(
+            model_name='summary',
+            name='text',
+        ),
+        migrations.AlterField(
+            model_name='format',
+            name='mime_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='books.mimetype'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.27 on 2026-10-19 11:32
+
+from django.db import migrations, models
+from django.db.models import Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least
+
+
+def fill_author_years(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+
+    book_authors = Book.authors.through.objects.filter(
+        book_id=OuterRef('pk')
+    ).values('book_id')
+
+    def get_years(aggregate):
+        birth_year = Subquery(
+            book_authors.annotate(year=aggregate('person__birth_year')).values('year')
+        )
+        death_year = Subquery(
+            book_authors.annotate(year=aggregate('person__death_year')).values('year')
+        )
+        return Coalesce(birth_year, death_year), Coalesce(death_year, birth_year)
+
+    Book.objects.update(
+        author_year_min=Least(*get_years(Min)),
+        author_year_max=Greatest(*get_years(Max))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_catalog_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='author_year_max',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_year_min',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_author_years, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_year_max'], name='books_book_author__769b50_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_year_min'], name='books_book_author__0ae627_idx'),
+        ),
+    ]
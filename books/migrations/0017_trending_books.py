@@ -0,0 +1,32 @@
+# Generated by Django 4.2.27 on 2026-10-19 11:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_book_author_years'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('download_counts', models.BinaryField()),
+                ('gutenberg_ids', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingBook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(unique=True)),
+                ('score', models.FloatField()),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='books.book')),
+            ],
+        ),
+    ]
@@ -1,9 +1,30 @@
 from django.db import models
 
+from .storage import compress_text, decompress_text, join_url
+
+
+class BookQuerySet(models.QuerySet):
+    def listed(self):
+        """
+        This gives the books that are listed by the API, leaving out those
+        without a title or a download count.
+        """
+
+        return self.exclude(download_count__isnull=True).exclude(title__isnull=True)
+
 
 class Book(models.Model):
+    # This is the first author's sort name, for sorting by author.
+    author_sort = models.CharField(blank=True, max_length=128)
+    # These are the latest and earliest of the authors' birth and death
+    # years, for filtering by author year without joining people.
+    author_year_max = models.SmallIntegerField(blank=True, null=True)
+    author_year_min = models.SmallIntegerField(blank=True, null=True)
     authors = models.ManyToManyField('Person')
     bookshelves = models.ManyToManyField('Bookshelf')
+    # This is `books.utils.get_content_hash` of the book as last parsed, to
+    # tell which books each catalog update changed.
+    content_hash = models.CharField(blank=True, max_length=32)
     copyright = models.BooleanField(null=True)
     download_count = models.PositiveIntegerField(blank=True, null=True)
     editors = models.ManyToManyField("Person", related_name="books_edited")
@@ -12,9 +33,21 @@ class Book(models.Model):
     media_type = models.CharField(max_length=16)
     subjects = models.ManyToManyField('Subject')
     title = models.CharField(blank=True, max_length=1024, null=True)
+    # This is the normalized title without a leading article, for sorting.
+    title_sort = models.CharField(blank=True, max_length=255)
     translators = models.ManyToManyField(
         'Person', related_name='books_translated')
 
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author_sort', 'title_sort', 'id']),
+            models.Index(fields=['author_year_max']),
+            models.Index(fields=['author_year_min']),
+            models.Index(fields=['title_sort', 'id']),
+        ]
+
     def __str__(self):
         if self.title:
             return self.title
@@ -35,10 +68,69 @@ class Bookshelf(models.Model):
         return self.name
 
 
+class CatalogChange(models.Model):
+    """ Each of these records that a catalog update created, changed, or deleted a book. """
+
+    CREATED = 'created'
+    DELETED = 'deleted'
+    UPDATED = 'updated'
+    CHANGE_CHOICES = [
+        (CREATED, 'Created'),
+        (DELETED, 'Deleted'),
+        (UPDATED, 'Updated'),
+    ]
+
+    change = models.CharField(choices=CHANGE_CHOICES, max_length=8)
+    gutenberg_id = models.PositiveIntegerField()
+    version = models.ForeignKey(
+        'CatalogVersion', on_delete=models.CASCADE, related_name='changes'
+    )
+
+    def __str__(self):
+        return '%s %s' % (self.change, self.gutenberg_id)
+
+
+class CatalogVersion(models.Model):
+    """ Each of these is recorded after a successful catalog update. """
+
+    book_count = models.PositiveIntegerField(default=0)
+    books_processed = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    # This is how long (in seconds) the whole update took.
+    duration = models.FloatField(blank=True, null=True)
+    # These are the catalog's facet counts, as given by `books.facets`.
+    facets = models.JSONField(default=dict)
+
+    def __str__(self):
+        return str(self.id)
+
+
+class DownloadSnapshot(models.Model):
+    """
+    Each of these holds every book's download count after a catalog update,
+    as arrays packed by `books.trending`.
+    """
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    download_counts = models.BinaryField()
+    # These are the books' Project Gutenberg IDs, in order.
+    gutenberg_ids = models.BinaryField()
+
+    def __str__(self):
+        return str(self.created)
+
+
 class Format(models.Model):
     book = models.ForeignKey('Book', on_delete=models.CASCADE)
-    mime_type = models.CharField(max_length=32)
-    url = models.CharField(max_length=256)
+    mime_type = models.ForeignKey('MimeType', on_delete=models.PROTECT)
+    # The URL is this template from `books.storage`, filled in with the
+    # book's Project Gutenberg ID, followed by the suffix.
+    url_template = models.PositiveSmallIntegerField(default=0)
+    url_suffix = models.CharField(max_length=256)
+
+    @property
+    def url(self):
+        return join_url(self.url_template, self.url_suffix, self.book.gutenberg_id)
 
     def __str__(self):
         return "%s (%s)" % (
@@ -54,15 +146,50 @@ class Language(models.Model):
         return self.code
 
 
+class MimeType(models.Model):
+    name = models.CharField(max_length=32, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Person(models.Model):
     birth_year = models.SmallIntegerField(blank=True, null=True)
     death_year = models.SmallIntegerField(blank=True, null=True)
     name = models.CharField(max_length=128)
+    # This is the normalized name, for sorting and prefix filtering.
+    sort_name = models.CharField(blank=True, max_length=128)
+
+    # These are numbers of listed books, updated with the catalog.
+    authored_count = models.PositiveIntegerField(default=0)
+    edited_count = models.PositiveIntegerField(default=0)
+    translated_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['sort_name', 'id'])]
 
     def __str__(self):
         return self.name
 
 
+class RelatedBook(models.Model):
+    """ Each of these is one of a book's most similar books, as found by `books.related`. """
+
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='related_books')
+    # This is 0 for the most similar book, 1 for the next, and so on.
+    rank = models.PositiveSmallIntegerField()
+    related = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_related_book_rank'),
+        ]
+
+    def __str__(self):
+        return '%s -> %s' % (self.book_id, self.related_id)
+
+
 class Subject(models.Model):
     name = models.CharField(max_length=256)
 
@@ -72,8 +199,32 @@ class Subject(models.Model):
 
 class Summary(models.Model):
     book = models.ForeignKey('Book', on_delete=models.CASCADE)
-    text = models.TextField()
+    # This is the text, compressed. It is only decompressed when read.
+    data = models.BinaryField()
+
+    @property
+    def text(self):
+        if not hasattr(self, '_text'):
+            self._text = decompress_text(self.data)
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self.data = compress_text(text)
+        self._text = text
 
     def __str__(self):
         preview_len = 24
         return f'{self.text[:preview_len]}...' if len(self.text) > preview_len else self.text
+
+
+class TrendingBook(models.Model):
+    """ Each of these is one of the books whose downloads grew most, as found by `books.trending`. """
+
+    book = models.OneToOneField('Book', on_delete=models.CASCADE, related_name='trending')
+    # This is 0 for the fastest-growing book, 1 for the next, and so on.
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+
+    def __str__(self):
+        return '%s: %s' % (self.rank, self.book_id)
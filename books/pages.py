@@ -0,0 +1,93 @@
+"""
+This caches the first few pages of book lists, which take most of the
+traffic, so that each is worked out once per catalog version rather than
+once per worker process. Pages are shared through the cache, keyed by the
+normalized query parameters that choose their books and fields, and hold:
+
+- the number of books in the whole list, so it isn't counted again,
+- the IDs of the page's books, in order, so the list isn't sorted again,
+- and, if PAGE_CACHE_BODIES is set, the serialized books, so their rows
+  aren't read again either.
+"""
+
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .facets import FILTER_PARAMETERS
+from .metrics import record_cache_lookup
+from .utils import normalize_query_string
+
+
+# Lists chosen by these parameters are rarely asked for twice, so their
+# pages would only push others out of the cache.
+UNCACHED_PARAMETERS = ('ids', 'search')
+
+# These are the parameters that make one page different from another. Any
+# others, such as cache-busting timestamps, are left out of cache keys, so
+# they don't fill the cache with copies of the same pages.
+KEY_PARAMETERS = FILTER_PARAMETERS + ('fields', 'omit', 'sort')
+
+# This is how long (in seconds) pages stay in the shared cache. They also
+# expire whenever the catalog version changes.
+PAGE_TIMEOUT = 24 * 60 * 60
+
+
+class CachedPage:
+    def __init__(self, count, ids, data=None):
+        self.count = count
+        self.ids = ids
+        self.data = data
+
+
+def get_page_cache_key(query_params):
+    """ This gives the cache key of a book list page, or None if it isn't cached. """
+
+    max_page = settings.PAGE_CACHE_MAX_PAGE
+    if not max_page or any(parameter in query_params for parameter in UNCACHED_PARAMETERS):
+        return None
+    try:
+        page_number = int(query_params.get('page', 1))
+    except ValueError:
+        return None
+    if not 1 <= page_number <= max_page:
+        return None
+
+    key_params = {
+        name: query_params.get(name)
+        for name in KEY_PARAMETERS
+        if name in query_params
+    }
+    # A missing page number is the first page.
+    key_params['page'] = str(page_number)
+    return 'book-page:' + normalize_query_string(key_params)
+
+
+def get_cached_page(cache_key, version):
+    """ This gives the `CachedPage` stored under `cache_key`, or None. """
+
+    stored_page = cache.get(cache_key, version=version)
+    record_cache_lookup('book-page', stored_page is not None)
+    if stored_page is None:
+        return None
+
+    count, id_bytes, data = stored_page
+    ids = array('I')
+    ids.frombytes(id_bytes)
+    return CachedPage(count, ids.tolist(), data)
+
+
+def cache_page(cache_key, version, page):
+    """
+    This stores a page under the catalog version that was current before it
+    was worked out, so a page from an older catalog is never stored as newer.
+    """
+
+    data = page.data if settings.PAGE_CACHE_BODIES else None
+    cache.set(
+        cache_key,
+        (page.count, array('I', page.ids).tobytes(), data),
+        PAGE_TIMEOUT,
+        version=version
+    )
@@ -0,0 +1,337 @@
+"""
+This puts parsed catalog data into PostgreSQL in bulk. Rows are streamed
+with COPY into temporary staging tables, and then merged into the real
+tables with a few set-based statements, all in one transaction.
+"""
+
+import tempfile
+
+from django.db import connection, transaction
+
+from .models import CatalogChange
+from .storage import compress_text, split_url
+from .utils import get_content_hash
+
+
+# These are the staging tables and their columns, in COPY order.
+STAGING_TABLES = {
+    'stage_book': (
+        'gutenberg_id integer PRIMARY KEY',
+        'title text',
+        'copyright boolean',
+        'download_count integer',
+        'media_type text',
+        'content_hash text',
+    ),
+    'stage_person': (
+        'gutenberg_id integer',
+        'role text',
+        'name text',
+        'birth_year smallint',
+        'death_year smallint',
+    ),
+    'stage_bookshelf': ('gutenberg_id integer', 'name text'),
+    'stage_format': (
+        'gutenberg_id integer',
+        'mime_type text',
+        'url_template smallint',
+        'url_suffix text',
+    ),
+    'stage_language': ('gutenberg_id integer', 'code text'),
+    'stage_subject': ('gutenberg_id integer', 'name text'),
+    'stage_summary': ('gutenberg_id integer', 'data bytea'),
+}
+
+PERSON_ROLES = {
+    'authors': 'books_book_authors',
+    'editors': 'books_book_editors',
+    'translators': 'books_book_translators',
+}
+
+
+def format_csv_value(value):
+    """
+    This formats a value for COPY in CSV format. Strings are always quoted,
+    so that empty strings are kept apart from NULLs, which are left empty.
+    Bytes are given in the hex format of `bytea`.
+    """
+
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, bytes):
+        return '\\x' + value.hex()
+    return '"' + value.replace('"', '""') + '"'
+
+
+class StagingFile:
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+
+    def writerow(self, values):
+        self.file.write(','.join(format_csv_value(value) for value in values))
+        self.file.write('\n')
+
+
+class StagingWriter:
+    """ This buffers staging rows in temporary CSV files. """
+
+    def __init__(self):
+        self.writers = {table: StagingFile() for table in STAGING_TABLES}
+
+    def add_book(self, book):
+        id = book['id']
+        self.writers['stage_book'].writerow([
+            id,
+            book['title'],
+            book['copyright'],
+            book['downloads'],
+            book['type'],
+            get_content_hash(book),
+        ])
+        for role in PERSON_ROLES:
+            for person in book[role]:
+                self.writers['stage_person'].writerow([
+                    id, role, person['name'], person['birth'], person['death']
+                ])
+        for bookshelf in book['bookshelves']:
+            self.writers['stage_bookshelf'].writerow([id, bookshelf])
+        for mime_type, url in book['formats'].items():
+            self.writers['stage_format'].writerow(
+                [id, mime_type, *split_url(url, id)]
+            )
+        for language in book['languages']:
+            self.writers['stage_language'].writerow([id, language])
+        for subject in book['subjects']:
+            self.writers['stage_subject'].writerow([id, subject])
+        for summary in book['summaries']:
+            self.writers['stage_summary'].writerow([id, compress_text(summary)])
+
+    def copy_to_staging_tables(self, cursor):
+        for table, columns in STAGING_TABLES.items():
+            cursor.execute('CREATE TEMPORARY TABLE %s (%s) ON COMMIT DROP' % (
+                table, ', '.join(columns)
+            ))
+            staging_file = self.writers[table].file
+            staging_file.seek(0)
+            cursor.copy_expert(
+                'COPY %s FROM STDIN WITH (FORMAT csv)' % table, staging_file
+            )
+            staging_file.close()
+            cursor.execute('ANALYZE %s' % table)
+
+
+def get_book_changes(cursor):
+    """
+    This gives the change to each staged book that is new, or whose content
+    hash differs from the one in the database, by Project Gutenberg ID.
+    """
+
+    cursor.execute('''
+        SELECT staged.gutenberg_id, book.id IS NULL
+        FROM stage_book staged
+        LEFT JOIN books_book book USING (gutenberg_id)
+        WHERE book.id IS NULL OR book.content_hash <> staged.content_hash
+    ''')
+    return {
+        gutenberg_id: CatalogChange.CREATED if created else CatalogChange.UPDATED
+        for gutenberg_id, created in cursor.fetchall()
+    }
+
+
+def merge_books(cursor):
+    cursor.execute('''
+        INSERT INTO books_book (
+            gutenberg_id,
+            title,
+            copyright,
+            download_count,
+            media_type,
+            content_hash,
+            author_sort,
+            title_sort
+        )
+        SELECT
+            gutenberg_id,
+            title,
+            copyright,
+            download_count,
+            media_type,
+            content_hash,
+            '',
+            ''
+        FROM stage_book
+        ON CONFLICT (gutenberg_id) DO UPDATE SET
+            title = EXCLUDED.title,
+            copyright = EXCLUDED.copyright,
+            download_count = EXCLUDED.download_count,
+            media_type = EXCLUDED.media_type,
+            content_hash = EXCLUDED.content_hash
+    ''')
+
+    # This maps each staged book to its row ID.
+    cursor.execute('''
+        CREATE TEMPORARY TABLE stage_book_id ON COMMIT DROP AS
+        SELECT book.id, book.gutenberg_id
+        FROM books_book book
+        JOIN stage_book USING (gutenberg_id)
+    ''')
+    cursor.execute('CREATE INDEX ON stage_book_id (gutenberg_id)')
+    cursor.execute('ANALYZE stage_book_id')
+
+
+def merge_lookup_rows(cursor):
+    """
+    This adds any new people, bookshelves, languages, MIME types, and
+    subjects.
+    """
+
+    cursor.execute('''
+        INSERT INTO books_person (name, birth_year, death_year)
+        SELECT DISTINCT name, birth_year, death_year
+        FROM stage_person staged
+        WHERE NOT EXISTS (
+            SELECT 1 FROM books_person person
+            WHERE person.name = staged.name
+            AND person.birth_year IS NOT DISTINCT FROM staged.birth_year
+            AND person.death_year IS NOT DISTINCT FROM staged.death_year
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO books_bookshelf (name)
+        SELECT DISTINCT name FROM stage_bookshelf
+        ON CONFLICT (name) DO NOTHING
+    ''')
+    cursor.execute('''
+        INSERT INTO books_language (code)
+        SELECT DISTINCT code FROM stage_language
+        ON CONFLICT (code) DO NOTHING
+    ''')
+    cursor.execute('''
+        INSERT INTO books_mimetype (name)
+        SELECT DISTINCT mime_type FROM stage_format
+        ON CONFLICT (name) DO NOTHING
+    ''')
+    cursor.execute('''
+        INSERT INTO books_subject (name)
+        SELECT DISTINCT name
+        FROM stage_subject staged
+        WHERE NOT EXISTS (
+            SELECT 1 FROM books_subject subject WHERE subject.name = staged.name
+        )
+    ''')
+
+
+def sync_rows(cursor, table, columns, desired_query, params=()):
+    """
+    This makes the rows of `table` for the staged books match the rows given
+    by `desired_query`, which selects `book_id` and then `columns`. Matching
+    rows are left alone, others are deleted, and missing ones are added.
+    """
+
+    cursor.execute('DROP TABLE IF EXISTS desired_rows')
+    cursor.execute(
+        'CREATE TEMPORARY TABLE desired_rows ON COMMIT DROP AS ' + desired_query,
+        params
+    )
+    cursor.execute('ANALYZE desired_rows')
+
+    all_columns = ('book_id',) + columns
+    matches = ' AND '.join(
+        'desired_rows.%s = existing.%s' % (column, column) for column in all_columns
+    )
+    cursor.execute('''
+        DELETE FROM %(table)s existing
+        WHERE existing.book_id IN (SELECT id FROM stage_book_id)
+        AND NOT EXISTS (SELECT 1 FROM desired_rows WHERE %(matches)s)
+    ''' % {'table': table, 'matches': matches})
+    cursor.execute('''
+        INSERT INTO %(table)s (%(columns)s)
+        SELECT %(columns)s FROM desired_rows
+        WHERE NOT EXISTS (
+            SELECT 1 FROM %(table)s existing WHERE %(matches)s
+        )
+    ''' % {
+        'table': table,
+        'columns': ', '.join(all_columns),
+        'matches': matches,
+    })
+
+
+def merge_relations(cursor):
+    for role, table in PERSON_ROLES.items():
+        # Duplicate people are possible, so the first one is used.
+        sync_rows(cursor, table, ('person_id',), '''
+            SELECT DISTINCT book.id AS book_id, person.id AS person_id
+            FROM stage_person staged
+            JOIN stage_book_id book USING (gutenberg_id)
+            JOIN (
+                SELECT MIN(id) AS id, name, birth_year, death_year
+                FROM books_person
+                GROUP BY name, birth_year, death_year
+            ) person
+            ON person.name = staged.name
+            AND person.birth_year IS NOT DISTINCT FROM staged.birth_year
+            AND person.death_year IS NOT DISTINCT FROM staged.death_year
+            WHERE staged.role = %s
+        ''', (role,))
+
+    sync_rows(cursor, 'books_book_bookshelves', ('bookshelf_id',), '''
+        SELECT DISTINCT book.id AS book_id, bookshelf.id AS bookshelf_id
+        FROM stage_bookshelf staged
+        JOIN stage_book_id book USING (gutenberg_id)
+        JOIN books_bookshelf bookshelf ON bookshelf.name = staged.name
+    ''')
+    sync_rows(cursor, 'books_book_languages', ('language_id',), '''
+        SELECT DISTINCT book.id AS book_id, language.id AS language_id
+        FROM stage_language staged
+        JOIN stage_book_id book USING (gutenberg_id)
+        JOIN books_language language ON language.code = staged.code
+    ''')
+    sync_rows(cursor, 'books_book_subjects', ('subject_id',), '''
+        SELECT DISTINCT book.id AS book_id, subject.id AS subject_id
+        FROM stage_subject staged
+        JOIN stage_book_id book USING (gutenberg_id)
+        JOIN (
+            SELECT MIN(id) AS id, name FROM books_subject GROUP BY name
+        ) subject ON subject.name = staged.name
+    ''')
+    sync_rows(cursor, 'books_format', ('mime_type_id', 'url_template', 'url_suffix'), '''
+        SELECT DISTINCT
+            book.id AS book_id,
+            mime_type.id AS mime_type_id,
+            staged.url_template,
+            staged.url_suffix
+        FROM stage_format staged
+        JOIN stage_book_id book USING (gutenberg_id)
+        JOIN books_mimetype mime_type ON mime_type.name = staged.mime_type
+    ''')
+    sync_rows(cursor, 'books_summary', ('data',), '''
+        SELECT DISTINCT book.id AS book_id, staged.data
+        FROM stage_summary staged
+        JOIN stage_book_id book USING (gutenberg_id)
+    ''')
+
+
+def put_books_in_db(books):
+    """
+    This creates or updates the given parsed books (as given by
+    `books.utils.get_book`) and all of their related data. It gives the
+    change to each created or updated book, by Project Gutenberg ID.
+    """
+
+    writer = StagingWriter()
+    for book in books:
+        writer.add_book(book)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        writer.copy_to_staging_tables(cursor)
+        changes = get_book_changes(cursor)
+        merge_books(cursor)
+        merge_lookup_rows(cursor)
+        merge_relations(cursor)
+
+    return changes
@@ -0,0 +1,150 @@
+"""
+This is opt-in profiling of API requests, turned on with PROFILE_REQUESTS.
+Each request's time is split into phases (building the filters, counting,
+fetching, serializing, and rendering) and every SQL statement is timed.
+The phases are given in a Server-Timing header, and requests slower than
+SLOW_REQUEST_THRESHOLD are logged with their SQL and query plans.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .utils import normalize_query_string
+
+
+# This many of a slow request's slowest statements are explained.
+EXPLAINED_QUERY_COUNT = 3
+
+logger = logging.getLogger('books.slow_requests')
+
+_profile = ContextVar('profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = perf_counter()
+        self.phase_seconds = {}
+        self.phase_stack = []
+        self.phase_started = None
+        self.queries = []
+
+    def start_phase(self, name):
+        now = perf_counter()
+        # Phases don't overlap: the time of a nested phase isn't counted in
+        # the phase around it.
+        if self.phase_stack:
+            self.add_time(self.phase_stack[-1], now - self.phase_started)
+        self.phase_stack.append(name)
+        self.phase_started = now
+
+    def end_phase(self):
+        now = perf_counter()
+        self.add_time(self.phase_stack.pop(), now - self.phase_started)
+        self.phase_started = now
+
+    def add_time(self, name, seconds):
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0) + seconds
+
+    def record_query(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((perf_counter() - start, sql, params, many))
+
+    def get_server_timing(self):
+        """ This gives the value of a Server-Timing header, in milliseconds. """
+
+        metrics = [
+            '%s;dur=%.1f' % (name, seconds * 1000)
+            for name, seconds in self.phase_seconds.items()
+        ]
+        metrics.append('sql;dur=%.1f;desc="%d queries"' % (
+            sum(query[0] for query in self.queries) * 1000, len(self.queries)
+        ))
+        metrics.append('total;dur=%.1f' % ((perf_counter() - self.start) * 1000))
+        return ', '.join(metrics)
+
+    def explain(self, sql, params):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    connection.ops.explain_query_prefix() + ' ' + sql, params
+                )
+                return [' '.join(str(value) for value in row) for row in cursor.fetchall()]
+        except Exception as error:
+            return ['EXPLAIN failed: %s' % error]
+
+    def log_if_slow(self, request, response):
+        seconds = perf_counter() - self.start
+        if seconds < settings.SLOW_REQUEST_THRESHOLD:
+            return
+
+        slowest_queries = sorted(
+            (query for query in self.queries if not query[3]),
+            key=lambda query: -query[0]
+        )[:EXPLAINED_QUERY_COUNT]
+
+        logger.warning(json.dumps({
+            'path': request.path,
+            'query': normalize_query_string(request.GET),
+            'status': response.status_code,
+            'ms': round(seconds * 1000, 1),
+            'phases_ms': {
+                name: round(phase_seconds * 1000, 1)
+                for name, phase_seconds in self.phase_seconds.items()
+            },
+            'queries': [
+                {'ms': round(query_seconds * 1000, 2), 'sql': sql}
+                for query_seconds, sql, _, _ in self.queries
+            ],
+            'plans': [
+                {
+                    'sql': sql,
+                    'plan': self.explain(sql, params),
+                }
+                for _, sql, params, _ in slowest_queries
+            ],
+        }))
+
+
+@contextmanager
+def profile_request():
+    """
+    This profiles the request handled inside it when PROFILE_REQUESTS is
+    on, giving its `RequestProfile`, or else None.
+    """
+
+    if not settings.PROFILE_REQUESTS:
+        yield None
+        return
+
+    profile = RequestProfile()
+    token = _profile.set(profile)
+    try:
+        with connection.execute_wrapper(profile.record_query):
+            yield profile
+    finally:
+        _profile.reset(token)
+
+
+@contextmanager
+def profile_phase(name):
+    """ This counts the time spent inside it as the given phase. """
+
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+
+    profile.start_phase(name)
+    try:
+        yield
+    finally:
+        profile.end_phase()
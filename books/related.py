@@ -0,0 +1,192 @@
+"""
+This finds related books for each listed book, from the subjects,
+bookshelves, and authors they share. Books are rows of a sparse matrix
+with a column for each subject, bookshelf, and author, weighted by how
+rare it is (as with TF-IDF), and related books are those whose rows have
+the highest cosine similarity. The top few for each book are stored as
+`RelatedBook` rows after each catalog update, so serving them is a single
+indexed lookup.
+"""
+
+from io import StringIO
+
+from django.db import connection, transaction
+import numpy as np
+from scipy import sparse
+
+from .models import Book, RelatedBook
+
+
+# This many related books are kept for each book.
+RELATED_BOOK_COUNT = 10
+
+# These are the relations that books are compared by, with the weight of
+# having each thing in common, before rarer things are weighted up.
+FEATURES = [
+    (Book.authors.through, 'person_id', 2.0),
+    (Book.bookshelves.through, 'bookshelf_id', 1.5),
+    (Book.subjects.through, 'subject_id', 1.0),
+]
+
+# Things shared by more than this fraction of books say little about how
+# alike they are, and would make the similarity matrix nearly dense, so
+# they are left out.
+MAX_FEATURE_SHARE = 0.02
+MIN_FEATURE_BOOKS = 500
+
+# Rows of the similarity matrix are worked out this many at a time.
+CHUNK_SIZE = 500
+
+# Related books are inserted this many at a time, where COPY isn't used.
+INSERT_BATCH_SIZE = 10000
+
+
+def get_feature_matrix(book_ids):
+    """
+    This gives a sparse matrix with a row for each of the sorted `book_ids`
+    and a column for each author, bookshelf, and subject that they share,
+    with rows scaled to unit length.
+    """
+
+    book_count = len(book_ids)
+    max_feature_books = max(MIN_FEATURE_BOOKS, int(book_count * MAX_FEATURE_SHARE))
+
+    rows = []
+    columns = []
+    weights = []
+    column_count = 0
+    for relation, field, weight in FEATURES:
+        pairs = np.array(
+            list(relation.objects.values_list('book_id', field)), dtype=np.int64
+        ).reshape(-1, 2)
+        # Pairs of unlisted books are left out.
+        positions = np.searchsorted(book_ids, pairs[:, 0]).clip(0, book_count - 1)
+        listed = book_ids[positions] == pairs[:, 0]
+        pairs, positions = pairs[listed], positions[listed]
+
+        values, feature_columns = np.unique(pairs[:, 1], return_inverse=True)
+        book_counts = np.bincount(feature_columns, minlength=len(values))
+        kept = (book_counts >= 2) & (book_counts <= max_feature_books)
+        rarity = np.log(book_count / np.maximum(book_counts, 1))
+
+        in_kept = kept[feature_columns]
+        rows.append(positions[in_kept])
+        columns.append(column_count + feature_columns[in_kept])
+        weights.append((weight * rarity[feature_columns])[in_kept])
+        column_count += len(values)
+
+    matrix = sparse.csr_matrix(
+        (
+            np.concatenate(weights).astype(np.float32),
+            (np.concatenate(rows), np.concatenate(columns)),
+        ),
+        shape=(book_count, column_count)
+    )
+    matrix.sum_duplicates()
+
+    lengths = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    lengths[lengths == 0] = 1
+    return sparse.diags(1 / lengths).dot(matrix).tocsr()
+
+
+def find_related_books(book_ids, download_counts, count=RELATED_BOOK_COUNT):
+    """
+    This gives arrays of (book position, related book position, rank,
+    score) for up to `count` related books of each book, most similar
+    first and then most downloaded.
+    """
+
+    matrix = get_feature_matrix(book_ids)
+    transposed = matrix.T.tocsr()
+
+    book_positions = []
+    related_positions = []
+    ranks = []
+    scores = []
+    for start in range(0, len(book_ids), CHUNK_SIZE):
+        similarities = (matrix[start:start + CHUNK_SIZE] @ transposed).tocsr()
+        for offset in range(similarities.shape[0]):
+            position = start + offset
+            begin, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+            candidates = similarities.indices[begin:end]
+            candidate_scores = similarities.data[begin:end]
+
+            not_self = candidates != position
+            candidates = candidates[not_self]
+            candidate_scores = candidate_scores[not_self]
+            if len(candidates) > count:
+                # Every candidate scoring at least the count-th best is kept,
+                # so ties are broken by downloads below.
+                threshold = np.partition(candidate_scores, -count)[-count]
+                best = candidate_scores >= threshold
+                candidates = candidates[best]
+                candidate_scores = candidate_scores[best]
+
+            order = np.lexsort((-download_counts[candidates], -candidate_scores))[:count]
+            book_positions.append(np.full(len(order), position))
+            related_positions.append(candidates[order])
+            ranks.append(np.arange(len(order)))
+            scores.append(candidate_scores[order])
+
+    return (
+        np.concatenate(book_positions),
+        np.concatenate(related_positions),
+        np.concatenate(ranks),
+        np.concatenate(scores),
+    )
+
+
+def store_related_books(rows):
+    """
+    This inserts (book ID, rank, related book ID, score) rows. They are
+    written with plain cursor calls, as model instances would take most of
+    the update's time, and with COPY on PostgreSQL.
+    """
+
+    table = connection.ops.quote_name(RelatedBook._meta.db_table)
+    columns = ('book_id', 'rank', 'related_id', 'score')
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            rows_file = StringIO()
+            for row in rows:
+                rows_file.write('%d\t%d\t%d\t%r\n' % row)
+            rows_file.seek(0)
+            cursor.copy_expert(
+                'COPY %s (%s) FROM STDIN' % (table, ', '.join(columns)), rows_file
+            )
+        else:
+            sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                table, ', '.join(columns), ', '.join(['%s'] * len(columns))
+            )
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                cursor.executemany(sql, rows[start:start + INSERT_BATCH_SIZE])
+
+
+def update_related_books():
+    """ This replaces the related books of every listed book, giving how many it stored. """
+
+    listed_books = np.array(
+        list(
+            Book.objects.listed().order_by('id').values_list('id', 'download_count')
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+    rows = []
+    if len(listed_books):
+        book_ids = listed_books[:, 0]
+        book_positions, related_positions, ranks, scores = find_related_books(
+            book_ids, listed_books[:, 1]
+        )
+        rows = list(zip(
+            book_ids[book_positions].tolist(),
+            ranks.tolist(),
+            book_ids[related_positions].tolist(),
+            scores.tolist()
+        ))
+
+    with transaction.atomic():
+        RelatedBook.objects.all().delete()
+        store_related_books(rows)
+
+    return len(rows)
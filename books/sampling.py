@@ -0,0 +1,85 @@
+"""
+This picks random books in constant time. For each combination of the
+`copyright`, `languages`, and `mime_type` filters, the IDs of the books it
+allows are read once per catalog version into a compact array, which is
+shared by worker processes through the cache. Random books are then drawn
+from the array by position, without counting or skipping rows in SQL.
+"""
+
+from array import array
+from collections import OrderedDict
+from random import sample
+from threading import Lock
+
+from django.core.cache import cache
+from django.http import QueryDict
+
+from .catalog import get_catalog_version
+from .metrics import record_cache_lookup
+from .utils import normalize_query_string
+
+
+# These are the filter parameters that random books can be limited by.
+SAMPLING_FILTER_PARAMETERS = ('copyright', 'languages', 'mime_type')
+
+# Each process keeps this many of the most recently used ID arrays.
+MAX_LOCAL_ID_ARRAYS = 64
+
+# This is how long (in seconds) ID arrays stay in the shared cache. They
+# also expire whenever the catalog version changes.
+ID_ARRAY_TIMEOUT = 24 * 60 * 60
+
+_id_arrays = OrderedDict()
+_id_arrays_lock = Lock()
+
+
+def get_sampling_filters(query_params):
+    """ This gives just the parameters of `query_params` that limit samples. """
+
+    filters = QueryDict(mutable=True)
+    for parameter in SAMPLING_FILTER_PARAMETERS:
+        if parameter in query_params:
+            filters[parameter] = query_params[parameter]
+    return filters
+
+
+def get_eligible_ids(query_params, get_ids):
+    """
+    This gives an array of the IDs of books allowed by the sampling filters
+    in `query_params`. If the array isn't in this process or the cache, it
+    is made from `get_ids(filters)`, an iterable of IDs.
+    """
+
+    filters = get_sampling_filters(query_params)
+    filter_key = normalize_query_string(filters)
+    version = get_catalog_version()
+    local_key = (version, filter_key)
+
+    with _id_arrays_lock:
+        ids = _id_arrays.get(local_key)
+        if ids is not None:
+            _id_arrays.move_to_end(local_key)
+            return ids
+
+    cache_key = 'book-ids:' + filter_key
+    id_bytes = cache.get(cache_key, version=version)
+    record_cache_lookup('book-ids', id_bytes is not None)
+    if id_bytes is None:
+        ids = array('I', get_ids(filters))
+        cache.set(cache_key, ids.tobytes(), ID_ARRAY_TIMEOUT, version=version)
+    else:
+        ids = array('I')
+        ids.frombytes(id_bytes)
+
+    with _id_arrays_lock:
+        _id_arrays[local_key] = ids
+        while len(_id_arrays) > MAX_LOCAL_ID_ARRAYS:
+            _id_arrays.popitem(last=False)
+
+    return ids
+
+
+def pick_random_ids(ids, count):
+    """ This gives up to `count` different IDs from `ids`, in random order. """
+
+    return sample(ids, min(count, len(ids)))
@@ -1,6 +1,21 @@
 from rest_framework import serializers
 
 from .models import *
+from .storage import get_mime_type_name, join_url
+
+
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Person
+        fields = (
+            'id',
+            'name',
+            'birth_year',
+            'death_year',
+            'authored_count',
+            'edited_count',
+            'translated_count',
+        )
 
 
 class BookshelfSerializer(serializers.ModelSerializer):
@@ -9,7 +24,19 @@ class BookshelfSerializer(serializers.ModelSerializer):
         fields = ('name',)
 
 
+class CatalogChangeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='gutenberg_id')
+    version = serializers.IntegerField(source='version_id')
+
+    class Meta:
+        model = CatalogChange
+        fields = ('id', 'version', 'change')
+
+
 class FormatSerializer(serializers.ModelSerializer):
+    mime_type = serializers.StringRelatedField()
+    url = serializers.CharField(read_only=True)
+
     class Meta:
         model = Format
         fields = ('book', 'mime_type', 'url')
@@ -52,6 +79,19 @@ class BookSerializer(serializers.ModelSerializer):
 
     lookup_field = 'gutenberg_id'
 
+    # These are the lookups that have to be prefetched for each field that
+    # needs related data.
+    prefetch_lookups = {
+        'authors': ('authors',),
+        'bookshelves': ('bookshelves',),
+        'editors': ('editors',),
+        'formats': ('format_set',),
+        'languages': ('languages',),
+        'subjects': ('subjects',),
+        'summaries': ('summary_set',),
+        'translators': ('translators',),
+    }
+
     class Meta:
         model = Book
         fields = (
@@ -70,13 +110,56 @@ class BookSerializer(serializers.ModelSerializer):
             'download_count'
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        field_names = self.context.get('field_names')
+        if field_names is not None:
+            for field_name in list(self.fields):
+                if field_name not in field_names:
+                    self.fields.pop(field_name)
+
+    @classmethod
+    def get_selected_field_names(cls, query_params):
+        """
+        This gives the names of the fields selected with the `fields` and
+        `omit` query parameters, in their usual order. Unknown names are
+        ignored.
+        """
+
+        field_names = list(cls.Meta.fields)
+
+        fields_string = query_params.get('fields')
+        if fields_string is not None:
+            selected_names = {name.strip() for name in fields_string.split(',')}
+            field_names = [name for name in field_names if name in selected_names]
+
+        omit_string = query_params.get('omit')
+        if omit_string is not None:
+            omitted_names = {name.strip() for name in omit_string.split(',')}
+            field_names = [name for name in field_names if name not in omitted_names]
+
+        return field_names
+
+    @classmethod
+    def get_prefetch_lookups(cls, field_names):
+        lookups = []
+        for field_name in field_names:
+            lookups += cls.prefetch_lookups.get(field_name, ())
+        return lookups
+
     def get_bookshelves(self, book):
         bookshelves = [bookshelf.name for bookshelf in book.bookshelves.all()]
         bookshelves.sort()
         return bookshelves
 
     def get_formats(self, book):
-        return {f.mime_type: f.url for f in book.get_formats()}
+        return {
+            get_mime_type_name(f.mime_type_id): join_url(
+                f.url_template, f.url_suffix, book.gutenberg_id
+            )
+            for f in book.format_set.all()
+        }
 
     def get_id(self, book):
         return book.gutenberg_id
@@ -92,6 +175,6 @@ class BookSerializer(serializers.ModelSerializer):
         return subjects
 
     def get_summaries(self, book):
-        summaries = [summary.text for summary in book.get_summaries()]
+        summaries = [summary.text for summary in book.summary_set.all()]
         summaries.sort()
         return summaries
@@ -0,0 +1,250 @@
+"""
+This serves a SQLite catalog from any number of read-only replicas, which
+share a snapshot directory with the one server that updates the catalog:
+
+- After each catalog update, the updater writes a compact copy of its
+  database with VACUUM INTO, named for the catalog version, and then a
+  manifest giving the copy's name, size, and SHA-256 checksum. Files are
+  only given their final names once complete, so replicas never see part of
+  one.
+- A thread in each replica process reads the manifest every
+  SNAPSHOT_CHECK_INTERVAL seconds. When it names a newer snapshot, the
+  thread checks the snapshot's size and checksum, and then points the
+  database settings at it. Each thread's connection is reopened on the new
+  snapshot at the start of its next request, so requests in progress finish
+  on the old one and none are dropped.
+
+Snapshots never change once published, so replicas open them as immutable,
+without taking any locks, which suits shared network volumes.
+"""
+
+from contextlib import closing
+from hashlib import sha256
+from threading import Thread
+from time import monotonic, sleep
+from urllib.parse import quote
+import json
+import logging
+import os
+import re
+import sqlite3
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+
+from .catalog import expire_catalog_version
+from .models import CatalogVersion
+
+
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_NAME_FORMAT = 'catalog-%d.db'
+SNAPSHOT_NAME_PATTERN = re.compile(r'^catalog-(\d+)\.db$')
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+# This is the version of the snapshot that this process serves.
+_version = None
+# These are the names and checksums of snapshots that failed their checks.
+_rejected_snapshots = set()
+
+
+def get_file_checksum(path):
+    checksum = sha256()
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(HASH_BUFFER_SIZE)
+            if not data:
+                break
+            checksum.update(data)
+    return checksum.hexdigest()
+
+
+def sync_file(path):
+    file = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(file)
+    finally:
+        os.close(file)
+
+
+def write_manifest(snapshot_dir, manifest):
+    """ This replaces the manifest in one step, so it's never seen half written. """
+
+    path = os.path.join(snapshot_dir, MANIFEST_NAME)
+    temporary_path = path + '.partial'
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_manifest(snapshot_dir):
+    """ This gives the snapshot directory's manifest, or None if there's no good one. """
+
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        return {
+            'version': int(manifest['version']),
+            'file': os.path.basename(manifest['file']),
+            'size': int(manifest['size']),
+            'sha256': str(manifest['sha256']),
+        }
+    except FileNotFoundError:
+        return None
+    except (KeyError, TypeError, ValueError):
+        logger.exception('The snapshot manifest could not be read.')
+        return None
+
+
+def remove_old_snapshots(snapshot_dir, keep):
+    """ This deletes all but the `keep` newest snapshots. """
+
+    versions = []
+    for name in os.listdir(snapshot_dir):
+        match = SNAPSHOT_NAME_PATTERN.match(name)
+        if match:
+            versions.append(int(match.group(1)))
+    versions.sort()
+    for version in versions[:-keep]:
+        os.remove(os.path.join(snapshot_dir, SNAPSHOT_NAME_FORMAT % version))
+
+
+def publish_snapshot(snapshot_dir=None, keep=None):
+    """
+    This publishes a snapshot of the database at its latest catalog
+    version, giving the snapshot's manifest.
+    """
+
+    snapshot_dir = snapshot_dir or settings.SNAPSHOT_DIR
+    keep = keep or settings.SNAPSHOT_KEEP
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    version = CatalogVersion.objects.order_by('-id').values_list(
+        'id', flat=True
+    ).first() or 0
+    name = SNAPSHOT_NAME_FORMAT % version
+    path = os.path.join(snapshot_dir, name)
+    temporary_path = os.path.join(snapshot_dir, '.%s.partial' % name)
+
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [temporary_path])
+        # Replicas read snapshots without the write-ahead log's extra files.
+        with closing(sqlite3.connect(temporary_path)) as snapshot:
+            snapshot.execute('PRAGMA journal_mode=DELETE')
+        sync_file(temporary_path)
+        manifest = {
+            'version': version,
+            'file': name,
+            'size': os.path.getsize(temporary_path),
+            'sha256': get_file_checksum(temporary_path),
+            'created': timezone.now().isoformat(),
+        }
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    write_manifest(snapshot_dir, manifest)
+    remove_old_snapshots(snapshot_dir, keep)
+    return manifest
+
+
+def get_snapshot_database_name(path):
+    return 'file:%s?mode=ro&immutable=1' % quote(os.path.abspath(path))
+
+
+def use_latest_snapshot():
+    """
+    This switches this process to the newest snapshot if it is newer than
+    the one in use and passes its checks, giving whether it did.
+    """
+
+    global _version
+
+    manifest = read_manifest(settings.SNAPSHOT_DIR)
+    if manifest is None or (_version is not None and manifest['version'] <= _version):
+        return False
+
+    snapshot_key = (manifest['file'], manifest['sha256'])
+    if snapshot_key in _rejected_snapshots:
+        return False
+
+    path = os.path.join(settings.SNAPSHOT_DIR, manifest['file'])
+    start = monotonic()
+    try:
+        intact = (
+            os.path.getsize(path) == manifest['size']
+            and get_file_checksum(path) == manifest['sha256']
+        )
+    except FileNotFoundError:
+        # The snapshot was replaced by a newer one while being checked.
+        return False
+    if not intact:
+        logger.error('Snapshot %s failed its checks, so it is not used.', manifest['file'])
+        _rejected_snapshots.add(snapshot_key)
+        return False
+
+    connections.settings[DEFAULT_DB_ALIAS]['NAME'] = get_snapshot_database_name(path)
+    _version = manifest['version']
+    expire_catalog_version()
+    logger.info(
+        'Process %d switched to snapshot %s, checked in %.2f seconds.',
+        os.getpid(),
+        manifest['file'],
+        monotonic() - start
+    )
+    return True
+
+
+def wait_for_snapshot():
+    """ This switches to the newest snapshot, waiting for one to be published. """
+
+    while not use_latest_snapshot() and _version is None:
+        logger.info('Waiting for a snapshot in %s...', settings.SNAPSHOT_DIR)
+        sleep(settings.SNAPSHOT_CHECK_INTERVAL)
+
+
+def record_database_name(sender, connection, **kwargs):
+    """ This notes the database that each new connection opened. """
+
+    connection.opened_database_name = connection.settings_dict['NAME']
+
+
+def close_outdated_connections(**kwargs):
+    """
+    This closes this thread's connections to snapshots that have been
+    replaced, so they're reopened on the new one. It is run between requests.
+    """
+
+    for db in connections.all(initialized_only=True):
+        opened_database_name = getattr(db, 'opened_database_name', None)
+        if (
+            db.connection is not None
+            and opened_database_name is not None
+            and opened_database_name != db.settings_dict['NAME']
+        ):
+            db.close()
+
+
+def watch_snapshots():
+    while True:
+        sleep(settings.SNAPSHOT_CHECK_INTERVAL)
+        try:
+            use_latest_snapshot()
+        except Exception:
+            logger.exception('Checking for a new snapshot failed.')
+
+
+def start_watching():
+    """ This starts checking for new snapshots in the background. """
+
+    Thread(target=watch_snapshots, name='snapshot-watcher', daemon=True).start()
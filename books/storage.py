@@ -0,0 +1,80 @@
+"""
+This packs the largest tables, formats and summaries, into fewer bytes,
+so that more of the catalog fits in the page cache:
+
+- Each distinct MIME type is stored once, in the `MimeType` table. Formats
+  refer to it by ID, and processes keep a map of IDs to names in memory, so
+  serving formats needs no join.
+- Most format URLs are built from the book's Project Gutenberg ID. They are
+  stored as the number of one of `URL_TEMPLATES`, which is filled in with
+  the ID, and the rest of the URL.
+- Summaries are compressed with zlib, and only decompressed when their text
+  is read.
+"""
+
+from threading import Lock
+import zlib
+
+
+# These are the beginnings of URLs, with `{id}` for the Project Gutenberg ID.
+# A format's `url_template` is its position in this list, so templates can
+# be added at the end, but never removed or moved. The first stands for URLs
+# that are stored whole.
+URL_TEMPLATES = (
+    '',
+    'https://www.gutenberg.org/ebooks/{id}',
+    'https://www.gutenberg.org/cache/epub/{id}/pg{id}',
+    'https://www.gutenberg.org/files/{id}/{id}',
+    'https://www.gutenberg.org/files/{id}/',
+)
+
+SUMMARY_COMPRESSION_LEVEL = 9
+
+_mime_type_names = {}
+_mime_type_names_lock = Lock()
+
+
+def split_url(url, gutenberg_id):
+    """
+    This gives the number of the longest URL template matching `url` for
+    the book, and the rest of the URL.
+    """
+
+    best_template = 0
+    best_prefix = ''
+    for template, pattern in enumerate(URL_TEMPLATES):
+        prefix = pattern.replace('{id}', str(gutenberg_id))
+        if len(prefix) > len(best_prefix) and url.startswith(prefix):
+            best_template = template
+            best_prefix = prefix
+    return best_template, url[len(best_prefix):]
+
+
+def join_url(template, suffix, gutenberg_id):
+    """ This puts back together a URL split by `split_url`. """
+
+    return URL_TEMPLATES[template].replace('{id}', str(gutenberg_id)) + suffix
+
+
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), SUMMARY_COMPRESSION_LEVEL)
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def get_mime_type_name(mime_type_id):
+    """
+    This gives the name of a MIME type from its ID. All names are read again
+    when an unknown ID comes up, which only happens after catalog updates.
+    """
+
+    name = _mime_type_names.get(mime_type_id)
+    if name is None:
+        from .models import MimeType
+
+        with _mime_type_names_lock:
+            _mime_type_names.update(MimeType.objects.values_list('id', 'name'))
+        name = _mime_type_names[mime_type_id]
+    return name
@@ -1,3 +1,659 @@
-from django.test import TestCase
+from itertools import product
+from threading import Thread
+from unittest import skipIf
+import gzip
+import json
+import os
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+
+from . import sampling, storage, throttling
+from .catalog import expire_catalog_version, get_catalog_version
+from .guardrails import QueryTimedOut, QueryTooComplex
+from .management.commands.updatecatalog import (
+    record_catalog_version, update_book_author_years
+)
+from .middleware import brotli, get_accepted_encodings
+from .models import *
+from .pages import get_page_cache_key
+from .serializers import BookSerializer
+from .views import filter_books
+
+
+# These are each book's authors' birth and death years.
+BOOK_AUTHOR_YEARS = [
+    [],
+    [(None, None)],
+    [(1800, None)],
+    [(None, 1850)],
+    [(1800, 1850)],
+    [(-450, -380)],
+    [(1700, 1760), (1900, 1980)],
+    [(None, 1600), (1820, None)],
+    [(1810, 1890), (None, None), (1795, 1870)],
+]
+
+YEARS = [None, '', 'x', -500, -450, -380, 0, 1600, 1700, 1760, 1799, 1800, 1801, 1850, 1900, 1980, 2000]
+
+
+def filter_by_joining_authors(queryset, author_year_start, author_year_end):
+    """ This is how books were filtered by author year before the ranges were stored. """
+
+    if author_year_end is not None:
+        queryset = queryset.filter(
+            Q(authors__birth_year__lte=author_year_end) |
+            Q(authors__death_year__lte=author_year_end)
+        )
+    if author_year_start is not None:
+        queryset = queryset.filter(
+            Q(authors__birth_year__gte=author_year_start) |
+            Q(authors__death_year__gte=author_year_start)
+        )
+    return queryset.distinct()
+
+
+def get_year(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AuthorYearFilterTests(TestCase):
+    def setUp(self):
+        for gutenberg_id, author_years in enumerate(BOOK_AUTHOR_YEARS, 1):
+            book = Book.objects.create(gutenberg_id=gutenberg_id, media_type='Text')
+            for number, (birth_year, death_year) in enumerate(author_years):
+                person, _ = Person.objects.get_or_create(
+                    name=f'Author {birth_year} {death_year} {number}',
+                    birth_year=birth_year,
+                    death_year=death_year
+                )
+                book.authors.add(person)
+        update_book_author_years()
+
+    def assert_filters_match(self):
+        for start, end in product(YEARS, YEARS):
+            query_params = QueryDict(mutable=True)
+            if start is not None:
+                query_params['author_year_start'] = str(start)
+            if end is not None:
+                query_params['author_year_end'] = str(end)
+            with self.subTest(start=start, end=end):
+                self.assertEqual(
+                    set(filter_books(Book.objects.all(), query_params)),
+                    set(filter_by_joining_authors(
+                        Book.objects.all(), get_year(start), get_year(end)
+                    ))
+                )
+
+    def test_filters_match_joining_authors(self):
+        self.assert_filters_match()
+
+    def test_ranges_follow_author_changes(self):
+        Person.objects.filter(birth_year=1800, death_year=1850).update(death_year=1920)
+        Person.objects.filter(birth_year=-450).update(birth_year=None, death_year=None)
+        Book.objects.get(gutenberg_id=2).authors.clear()
+        Book.objects.get(gutenberg_id=1).authors.add(
+            Person.objects.create(name='Author 1990 2050', birth_year=1990, death_year=2050)
+        )
+        update_book_author_years()
+
+        self.assertEqual(
+            list(Book.objects.order_by('gutenberg_id').values_list(
+                'author_year_min', 'author_year_max'
+            )),
+            [
+                (1990, 2050),
+                (None, None),
+                (1800, 1800),
+                (1850, 1850),
+                (1800, 1920),
+                (None, None),
+                (1700, 1980),
+                (1600, 1820),
+                (1795, 1890),
+            ]
+        )
+        self.assert_filters_match()
+
+
+# API tests get a cache of their own, so pages and compressed bodies cached
+# by other tests, or by a server using the same cache directory, aren't
+# served to them.
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class BookAPITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # The version is read now, so it isn't among the queries counted.
+        expire_catalog_version()
+        get_catalog_version()
+        # Rows made by earlier tests may have had the same IDs, so what each
+        # process keeps about them is forgotten.
+        sampling._id_arrays.clear()
+        storage._mime_type_names.clear()
+
+    def create_book(self, gutenberg_id, download_count=None, **fields):
+        return Book.objects.create(
+            gutenberg_id=gutenberg_id,
+            title=fields.pop('title', f'Book {gutenberg_id}'),
+            download_count=100 - gutenberg_id if download_count is None else download_count,
+            media_type=fields.pop('media_type', 'Text'),
+            **fields
+        )
+
+    def get_gutenberg_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [book['id'] for book in response.json()['results']]
+
+
+@override_settings(PAGE_CACHE_BODIES=False)
+class UnlistedBookTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for gutenberg_id in range(1, 4):
+            self.create_book(gutenberg_id)
+
+    def test_cached_page_leaves_out_deleted_book(self):
+        self.assertEqual(self.get_gutenberg_ids(self.client.get('/books/')), [1, 2, 3])
+
+        Book.objects.filter(gutenberg_id=2).delete()
+        response = self.client.get('/books/')
+
+        self.assertEqual(self.get_gutenberg_ids(response), [1, 3])
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_related_leaves_out_unlisted_book(self):
+        books = {book.gutenberg_id: book for book in Book.objects.all()}
+        for rank, gutenberg_id in enumerate([2, 3]):
+            RelatedBook.objects.create(
+                book=books[1], rank=rank, related=books[gutenberg_id], score=1
+            )
+
+        Book.objects.filter(gutenberg_id=2).update(download_count=None)
+        response = self.client.get('/books/1/related/')
+
+        self.assertEqual(self.get_gutenberg_ids(response), [3])
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_related_is_not_found_for_non_numeric_id(self):
+        self.assertEqual(self.client.get('/books/abc/related/').status_code, 404)
+
+
+class PageCacheKeyTests(TestCase):
+    def test_keys_ignore_unknown_parameters(self):
+        self.assertEqual(
+            get_page_cache_key(QueryDict('languages=fr,en&_=1700000000&utm_source=feed')),
+            get_page_cache_key(QueryDict('languages=en,fr'))
+        )
+
+    def test_missing_page_is_first_page(self):
+        self.assertEqual(
+            get_page_cache_key(QueryDict('')),
+            get_page_cache_key(QueryDict('page=1'))
+        )
+        self.assertNotEqual(
+            get_page_cache_key(QueryDict('')),
+            get_page_cache_key(QueryDict('page=2'))
+        )
+
+
+class FieldSelectionTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        book = self.create_book(1)
+        book.authors.add(Person.objects.create(name='Author'))
+        book.bookshelves.add(Bookshelf.objects.create(name='Shelf'))
+        book.languages.add(Language.objects.create(code='en'))
+        book.subjects.add(Subject.objects.create(name='Subject'))
+        Format.objects.create(
+            book=book,
+            mime_type=MimeType.objects.create(name='text/plain'),
+            url_suffix='https://example.com/1.txt'
+        )
+        Summary.objects.create(book=book, text='A summary.')
+
+    def get_field_names(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return list(response.json()['results'][0])
+
+    def test_all_fields_by_default(self):
+        self.assertEqual(self.get_field_names('/books/'), list(BookSerializer.Meta.fields))
+
+    def test_fields_keeps_only_given_fields(self):
+        self.assertEqual(
+            self.get_field_names('/books/?fields=title,id,unknown'), ['id', 'title']
+        )
+
+    def test_omit_leaves_out_given_fields(self):
+        self.assertEqual(
+            self.get_field_names('/books/?omit=formats,summaries'),
+            [
+                name for name in BookSerializer.Meta.fields
+                if name not in ('formats', 'summaries')
+            ]
+        )
+
+    def test_fields_and_omit_together(self):
+        self.assertEqual(
+            self.get_field_names('/books/?fields=id,title,authors&omit=authors'),
+            ['id', 'title']
+        )
+
+    def test_unselected_relations_are_not_fetched(self):
+        # These are the count, the page's IDs, and the page's books.
+        with self.assertNumQueries(3):
+            self.get_field_names('/books/?fields=id,title')
+        cache.clear()
+        # Each related field adds one prefetch.
+        with self.assertNumQueries(5):
+            self.get_field_names('/books/?fields=id,title,authors,languages')
+        # Book details are a single query.
+        with self.assertNumQueries(1):
+            response = self.client.get('/books/1/?fields=id,title')
+        self.assertEqual(response.json(), {'id': 1, 'title': 'Book 1'})
+
+
+class CompressionTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        # This makes the list long enough to be worth compressing.
+        for gutenberg_id in range(1, 33):
+            self.create_book(gutenberg_id)
+
+    def get_books(self, accept_encoding):
+        response = self.client.get('/books/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        return response
+
+    def test_accepted_encodings(self):
+        supported_encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        for accept_encoding, encodings in [
+            ('', []),
+            ('identity', []),
+            ('gzip', ['gzip']),
+            ('gzip, deflate, br', supported_encodings),
+            ('gzip;q=0.5, br', supported_encodings),
+            ('gzip, br;q=0.5', ['gzip', 'br'][:len(supported_encodings)]),
+            ('gzip;q=0, br;q=0', []),
+            ('*', supported_encodings),
+            ('*;q=0', []),
+            ('br;q=x, GZIP', ['gzip']),
+        ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(get_accepted_encodings(accept_encoding), encodings)
+
+    def test_gzip(self):
+        response = self.get_books('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content)),
+            self.get_books('identity').json()
+        )
+
+    @skipIf(brotli is None, 'Brotli is not installed.')
+    def test_brotli(self):
+        response = self.get_books('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(
+            json.loads(brotli.decompress(response.content)),
+            self.get_books('identity').json()
+        )
+
+    def test_uncompressed(self):
+        for accept_encoding in ['', 'identity', 'gzip;q=0, br;q=0']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get_books(accept_encoding)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(len(response.json()['results']), 32)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/books/1/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class GuardrailTests(BookAPITestCase):
+    def test_costly_queries_are_refused(self):
+        # Each search term costs 4, and topic costs 6.
+        with override_settings(QUERY_COST_LIMIT=40):
+            response = self.client.get(
+                '/books/?topic=fiction&search=' + '%20'.join(['word'] * 9)
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['detail'], QueryTooComplex.default_detail)
+
+            response = self.client.get('/books/?topic=fiction&search=word')
+            self.assertEqual(response.status_code, 200)
+
+    def test_deep_pages_are_not_refused(self):
+        self.create_book(1)
+        self.assertEqual(self.client.get('/books/?page=99999').status_code, 404)
+
+    @skipIf(connection.vendor != 'sqlite', 'Statements are only timed in steps on SQLite.')
+    def test_slow_queries_are_stopped(self):
+        Book.objects.bulk_create(
+            Book(gutenberg_id=gutenberg_id, title='Book', download_count=1, media_type='Text')
+            for gutenberg_id in range(1, 5001)
+        )
+        # Any statement taking more than one step of the progress handler
+        # is over this limit.
+        with override_settings(QUERY_TIME_LIMIT=1e-9):
+            response = self.client.get('/books/?search=book')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['detail'], QueryTimedOut.default_detail)
+
+        # The connection is left usable.
+        self.assertEqual(self.client.get('/books/?fields=id&search=book').status_code, 200)
+
+
+class ThrottlingTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_book(1)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Each test counts in a file of its own, opened afresh.
+        throttle_settings = override_settings(
+            API_KEYS=['secret'],
+            THROTTLE_DB_PATH=os.path.join(directory.name, 'throttle.db'),
+            REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': {
+                    'client': '3/min',
+                    'client_key': '5/min',
+                    'search': '2/min',
+                    'search_key': None,
+                },
+            }
+        )
+        throttle_settings.enable()
+        self.addCleanup(throttle_settings.disable)
+        self.close_counter_connection()
+        self.addCleanup(self.close_counter_connection)
+
+    def close_counter_connection(self):
+        connection = getattr(throttling._connections, 'connection', None)
+        if connection is not None:
+            connection.close()
+            del throttling._connections.connection
+
+    def get_rate_limit(self, response):
+        return (
+            response['RateLimit-Limit'],
+            response['RateLimit-Remaining'],
+            int(response['RateLimit-Reset'])
+        )
+
+    def test_rate_limit_headers(self):
+        for remaining in ['2', '1', '0']:
+            response = self.client.get('/books/')
+            self.assertEqual(response.status_code, 200)
+            limit, response_remaining, reset = self.get_rate_limit(response)
+            self.assertEqual((limit, response_remaining), ('3', remaining))
+            self.assertTrue(0 < reset <= 60)
+
+        response = self.client.get('/books/')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+    def test_search_limit_is_reported_when_closer(self):
+        response = self.client.get('/books/?search=book')
+        self.assertEqual(self.get_rate_limit(response)[:2], ('2', '1'))
+        response = self.client.get('/books/?search=book')
+        self.assertEqual(self.get_rate_limit(response)[:2], ('2', '0'))
+
+        # Searches count against the client limit too, which has one left.
+        response = self.client.get('/books/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_rate_limit(response)[:2], ('3', '0'))
+        self.assertEqual(self.client.get('/books/?search=book').status_code, 429)
+
+    def test_api_keys_have_their_own_limit(self):
+        for _ in range(3):
+            self.client.get('/books/')
+        self.assertEqual(self.client.get('/books/').status_code, 429)
+
+        response = self.client.get('/books/', HTTP_X_API_KEY='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_rate_limit(response)[:2], ('5', '4'))
+        # Unknown keys count as the client's address.
+        self.assertEqual(
+            self.client.get('/books/', HTTP_X_API_KEY='guess').status_code, 429
+        )
+
+    def test_counters_are_shared_between_connections(self):
+        self.assertEqual(throttling.count_request('client:test', 1), 1)
+
+        # Another thread has a connection of its own, as another worker
+        # process would.
+        counts = []
+        thread = Thread(target=lambda: counts.append(
+            throttling.count_request('client:test', 1)
+        ))
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [2])
+
+        self.assertEqual(throttling.count_request('client:test', 1), 3)
+        # Each new window starts again from 1.
+        self.assertEqual(throttling.count_request('client:test', 2), 1)
+
+
+class RandomBookTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+
+        english = Language.objects.create(code='en')
+        french = Language.objects.create(code='fr')
+        for gutenberg_id in range(1, 61):
+            book = self.create_book(gutenberg_id, copyright=gutenberg_id % 3 == 0)
+            book.languages.add(french if gutenberg_id % 2 else english)
+        # These aren't listed, so they are never picked.
+        self.create_book(61, title=None)
+        Book.objects.filter(gutenberg_id__in=[1, 2, 3, 4]).update(download_count=None)
+
+    def get_random_books(self, query_string):
+        response = self.client.get('/books/random/?' + query_string)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        books = response.json()['results']
+        gutenberg_ids = [book['id'] for book in books]
+        self.assertEqual(len(gutenberg_ids), len(set(gutenberg_ids)))
+        return response.json()['count'], books
+
+    def test_results_are_listed_and_different(self):
+        listed_ids = set(range(5, 61))
+        for _ in range(5):
+            count, books = self.get_random_books('limit=32')
+            self.assertEqual(count, len(listed_ids))
+            self.assertEqual(len(books), 32)
+            self.assertLessEqual({book['id'] for book in books}, listed_ids)
+
+    def test_results_follow_filters(self):
+        for query_string, is_allowed in [
+            ('languages=fr', lambda book: book['languages'] == ['fr']),
+            ('copyright=true', lambda book: book['copyright'] is True),
+            ('copyright=false&languages=en', lambda book: (
+                book['copyright'] is False and book['languages'] == ['en']
+            )),
+        ]:
+            with self.subTest(query_string=query_string):
+                expected_count = len(filter_books(
+                    Book.objects.listed(), QueryDict(query_string)
+                ))
+                count, books = self.get_random_books(query_string + '&limit=32')
+                self.assertEqual(count, expected_count)
+                self.assertEqual(len(books), min(expected_count, 32))
+                self.assertTrue(all(is_allowed(book) for book in books))
+
+    def test_every_eligible_book_can_be_picked(self):
+        picked_ids = set()
+        for _ in range(50):
+            picked_ids.update(
+                book['id'] for book in self.get_random_books('languages=en&limit=8')[1]
+            )
+        self.assertEqual(picked_ids, set(range(6, 61, 2)))
+
+    def test_limits(self):
+        self.assertEqual(len(self.get_random_books('')[1]), 1)
+        self.assertEqual(len(self.get_random_books('limit=0')[1]), 1)
+        self.assertEqual(len(self.get_random_books('limit=1000')[1]), 32)
+        self.assertEqual(self.client.get('/books/random/?limit=x').status_code, 400)
+
+
+class PackedStorageTests(BookAPITestCase):
+    GUTENBERG_ID = 1234
+
+    # These cover each URL template, URLs of other books and sites, and
+    # URLs that are just a template.
+    FORMATS = {
+        'application/epub+zip': 'https://www.gutenberg.org/ebooks/1234.epub3.images',
+        'application/rdf+xml': 'https://www.gutenberg.org/ebooks/1234.rdf',
+        'application/x-mobipocket-ebook': 'https://www.gutenberg.org/ebooks/1234',
+        'image/jpeg': 'https://www.gutenberg.org/cache/epub/1234/pg1234.cover.medium.jpg',
+        'text/html': 'https://www.gutenberg.org/files/1234/1234-h/1234-h.htm',
+        'text/plain': 'https://www.gutenberg.org/files/1234/',
+        'text/plain; charset=us-ascii': 'https://www.gutenberg.org/ebooks/12345.txt.utf-8',
+        'audio/mpeg': 'https://www.gutenberg.org/files/999/1234/01.mp3',
+        'application/zip': 'http://example.com/ebooks/1234?x=%C3%A9&y=é',
+        'application/octet-stream': '',
+    }
+
+    SUMMARIES = [
+        '',
+        'A short summary.',
+        'Les Misérables — « roman » de Victor Hugo, 1862.\n\tNew line\r\n',
+        '日本語の要約。\x00 Emoji: \U0001f4da',
+        ' '.join(['A long summary with many repeated words.'] * 500),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        book = self.create_book(self.GUTENBERG_ID, download_count=1)
+        for name, url in self.FORMATS.items():
+            url_template, url_suffix = storage.split_url(url, self.GUTENBERG_ID)
+            Format.objects.create(
+                book=book,
+                mime_type=MimeType.objects.create(name=name),
+                url_template=url_template,
+                url_suffix=url_suffix
+            )
+        for text in self.SUMMARIES:
+            Summary.objects.create(book=book, text=text)
+
+    def test_rows_give_back_original_values(self):
+        urls = {
+            format_.mime_type.name: format_.url
+            for format_ in Format.objects.select_related('book', 'mime_type')
+        }
+        self.assertEqual(urls, self.FORMATS)
+        # Most URLs are stored as a template and a shorter suffix.
+        self.assertEqual(Format.objects.filter(url_template=0).count(), 3)
+
+        texts = [summary.text for summary in Summary.objects.order_by('id')]
+        self.assertEqual(
+            [text.encode('utf-8') for text in texts],
+            [text.encode('utf-8') for text in self.SUMMARIES]
+        )
+        self.assertLess(
+            len(Summary.objects.order_by('id').last().data), len(self.SUMMARIES[-1]) // 10
+        )
+
+    def test_api_gives_back_original_values(self):
+        book = self.client.get('/books/%d/' % self.GUTENBERG_ID).json()
+        self.assertEqual(book['formats'], self.FORMATS)
+        self.assertEqual(book['summaries'], sorted(self.SUMMARIES))
+
+
+class CatalogChangeTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for gutenberg_id in range(1, 4):
+            self.create_book(gutenberg_id)
+        self.first_version = record_catalog_version(3, {
+            1: CatalogChange.CREATED,
+            2: CatalogChange.CREATED,
+            3: CatalogChange.CREATED,
+        }, 1.0).id
+
+        Book.objects.filter(gutenberg_id=2).update(title='New title')
+        Book.objects.filter(gutenberg_id=3).delete()
+        # This book has no download count yet, so it isn't listed.
+        Book.objects.create(gutenberg_id=4, title='Book 4', media_type='Text')
+        self.second_version = record_catalog_version(3, {
+            2: CatalogChange.UPDATED,
+            3: CatalogChange.DELETED,
+            4: CatalogChange.CREATED,
+        }, 1.0).id
+
+    def get_changes(self, query_string):
+        response = self.client.get('/changes/?' + query_string)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_changes_since_version(self):
+        first_changes = [
+            {'id': 1, 'version': self.first_version, 'change': 'created'},
+            {'id': 2, 'version': self.first_version, 'change': 'created'},
+            {'id': 3, 'version': self.first_version, 'change': 'created'},
+        ]
+        second_changes = [
+            {'id': 2, 'version': self.second_version, 'change': 'updated'},
+            {'id': 3, 'version': self.second_version, 'change': 'deleted'},
+            {'id': 4, 'version': self.second_version, 'change': 'created'},
+        ]
+        self.assertEqual(self.get_changes(''), first_changes + second_changes)
+        self.assertEqual(self.get_changes('since=0'), first_changes + second_changes)
+        self.assertEqual(
+            self.get_changes('since=%d' % self.first_version), second_changes
+        )
+        self.assertEqual(self.get_changes('since=%d' % self.second_version), [])
+
+    def test_since_must_be_a_number(self):
+        self.assertEqual(self.client.get('/changes/?since=latest').status_code, 400)
+
+    def test_documents(self):
+        changes = self.get_changes('since=%d&documents=true' % self.first_version)
+        books = {change['id']: change['book'] for change in changes}
+
+        self.assertEqual(books[2]['title'], 'New title')
+        self.assertEqual(set(books[2]), set(BookSerializer.Meta.fields))
+        # Deleted and unlisted books have no document.
+        self.assertIsNone(books[3])
+        self.assertIsNone(books[4])
+
+    def test_pages_follow_the_recorded_order(self):
+        with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK, 'PAGE_SIZE': 2
+        }):
+            changes = []
+            page_count = 0
+            response = self.client.get('/changes/?documents=true')
+            while True:
+                self.assertEqual(response.status_code, 200)
+                changes += response.json()['results']
+                page_count += 1
+                if response.json()['next'] is None:
+                    break
+                response = self.client.get(response.json()['next'])
+        self.assertEqual(page_count, 3)
+        self.assertEqual(
+            [(change['id'], change['change']) for change in changes],
+            [
+                (1, 'created'), (2, 'created'), (3, 'created'),
+                (2, 'updated'), (3, 'deleted'), (4, 'created'),
+            ]
+        )
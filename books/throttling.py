@@ -0,0 +1,172 @@
+"""
+This limits how many requests each client can make in a fixed window of
+time. Clients are known by their API key if they send a known one in the
+X-API-Key header, or else by IP address. Counters are kept in a small
+SQLite file, so all server worker processes on a machine share them.
+"""
+
+from hashlib import sha256
+from math import ceil
+from random import random
+from threading import local
+from time import time
+import sqlite3
+
+from django.conf import settings
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+API_KEY_HEADER = 'HTTP_X_API_KEY'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# About this fraction of requests also delete counters of past windows.
+CLEAN_UP_CHANCE = 0.001
+
+_connections = local()
+
+
+def get_counter_connection():
+    """ This gives the current thread's connection to the counter file. """
+
+    connection = getattr(_connections, 'connection', None)
+    if connection is None:
+        connection = sqlite3.connect(
+            settings.THROTTLE_DB_PATH,
+            isolation_level=None,
+            timeout=1
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Counters don't need to survive a crash of the machine.
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS counter (
+                key TEXT PRIMARY KEY,
+                window INTEGER NOT NULL,
+                count INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        _connections.connection = connection
+    return connection
+
+
+def count_request(key, window):
+    """
+    This adds 1 to the count of requests for `key` in `window`, starting
+    again from 1 in each new window, and gives the new count.
+    """
+
+    connection = get_counter_connection()
+    count, = connection.execute('''
+        INSERT INTO counter (key, window, count) VALUES (?, ?, 1)
+        ON CONFLICT (key) DO UPDATE SET
+            count = CASE WHEN window = excluded.window THEN count + 1 ELSE 1 END,
+            window = excluded.window
+        RETURNING count
+    ''', (key, window)).fetchone()
+
+    if random() < CLEAN_UP_CHANCE:
+        connection.execute('DELETE FROM counter WHERE window < ?', (window,))
+
+    return count
+
+
+def parse_rate(rate):
+    """
+    This gives the number of requests and the seconds in each window for
+    a rate like '100/min', or (None, None) if there's no rate.
+    """
+
+    if not rate:
+        return None, None
+    number, period = rate.split('/')
+    return int(number), PERIODS[period[0]]
+
+
+class ClientRateThrottle(BaseThrottle):
+    """
+    This limits all of a client's requests. Rates for the `scope`, and for
+    the scope plus '_key' for clients with API keys, are set in the
+    DEFAULT_THROTTLE_RATES setting of REST_FRAMEWORK.
+    """
+
+    scope = 'client'
+
+    def applies_to(self, request):
+        return True
+
+    def get_client(self, request):
+        api_key = request.META.get(API_KEY_HEADER)
+        if api_key and api_key in settings.API_KEYS:
+            return 'key:' + sha256(api_key.encode()).hexdigest()[:16], True
+        return 'ip:' + (self.get_ident(request) or ''), False
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not self.applies_to(request):
+            return True
+
+        client, has_api_key = self.get_client(request)
+        scope = self.scope + '_key' if has_api_key else self.scope
+        limit, duration = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+        if limit is None:
+            return True
+
+        now = time()
+        window = int(now // duration)
+        try:
+            count = count_request(scope + ':' + client, window)
+        except sqlite3.Error:
+            # Requests are allowed when the counters can't be reached.
+            return True
+        reset = (window + 1) * duration - now
+
+        # `RateLimitHeadersMixin` reports the closest limit to running out.
+        rate_limits = getattr(request, 'rate_limits', [])
+        rate_limits.append((limit, max(limit - count, 0), reset))
+        request.rate_limits = rate_limits
+
+        if count > limit:
+            self.wait_seconds = ceil(reset)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class SearchRateThrottle(ClientRateThrottle):
+    """
+    This sets a smaller budget for requests that search text, which are
+    the most expensive. They count against the client scope too.
+    """
+
+    scope = 'search'
+
+    def applies_to(self, request):
+        return 'search' in request.GET or 'topic' in request.GET
+
+
+class RateLimitHeadersMixin:
+    """
+    This adds RateLimit-Limit, RateLimit-Remaining, and RateLimit-Reset
+    headers to responses of a throttled view.
+    """
+
+    throttle_classes = [ClientRateThrottle, SearchRateThrottle]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        rate_limits = getattr(request, 'rate_limits', None)
+        if rate_limits:
+            limit, remaining, reset = min(
+                rate_limits, key=lambda rate_limit: rate_limit[1]
+            )
+            response['RateLimit-Limit'] = str(limit)
+            response['RateLimit-Remaining'] = str(remaining)
+            response['RateLimit-Reset'] = str(ceil(reset))
+
+        return response
@@ -0,0 +1,154 @@
+"""
+This keeps a history of books' download counts and finds the books whose
+downloads are growing fastest. Project Gutenberg gives each book's downloads
+over the last 30 days, which each catalog update overwrites, so:
+
+- After each update, every book's count is saved in one `DownloadSnapshot`
+  row, as two arrays compressed with zlib: the books' sorted Project
+  Gutenberg IDs, stored as the differences between them, and their counts.
+- Each book's trending score is then how much its count grew since the
+  snapshot from about TRENDING_WINDOW earlier, relative to its count then.
+  Scores are worked out for all books at once, and the top
+  TRENDING_BOOK_COUNT are stored as `TrendingBook` rows, so serving them is
+  a single indexed lookup.
+"""
+
+from datetime import timedelta
+import zlib
+
+from django.db import transaction
+import numpy as np
+
+from .models import Book, DownloadSnapshot, TrendingBook
+
+
+# Growth is measured over about this long. Until there are snapshots this
+# old, it is measured since the oldest one.
+TRENDING_WINDOW = timedelta(days=7)
+
+# Download snapshots are kept this long.
+DOWNLOAD_HISTORY = timedelta(days=90)
+
+# This many trending books are kept.
+TRENDING_BOOK_COUNT = 1000
+
+# Growth is divided by books' earlier counts plus this, so that a few more
+# downloads of a rarely read book don't make it trend.
+GROWTH_SMOOTHING = 100
+
+# Books have to gain at least this many downloads to trend.
+MIN_GROWTH = 10
+
+SNAPSHOT_COMPRESSION_LEVEL = 6
+
+
+def pack_array(values):
+    return zlib.compress(values.astype('<u4').tobytes(), SNAPSHOT_COMPRESSION_LEVEL)
+
+
+def unpack_array(data):
+    return np.frombuffer(zlib.decompress(data), dtype='<u4').astype(np.int64)
+
+
+def unpack_snapshot(snapshot):
+    """ This gives a snapshot's Project Gutenberg IDs and download counts. """
+
+    gutenberg_ids = np.cumsum(unpack_array(snapshot.gutenberg_ids))
+    return gutenberg_ids, unpack_array(snapshot.download_counts)
+
+
+def take_download_snapshot():
+    """ This saves every book's download count in a new snapshot, giving it. """
+
+    books = np.array(
+        list(
+            Book.objects.exclude(download_count__isnull=True).order_by(
+                'gutenberg_id'
+            ).values_list('gutenberg_id', 'download_count')
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+    return DownloadSnapshot.objects.create(
+        # Neighbouring IDs are close together, so their differences are
+        # small and compress far better.
+        gutenberg_ids=pack_array(np.diff(books[:, 0], prepend=0)),
+        download_counts=pack_array(books[:, 1])
+    )
+
+
+def get_baseline_snapshot(snapshot):
+    """
+    This gives the snapshot that growth up to `snapshot` is measured from,
+    or None if there is no earlier one.
+    """
+
+    earlier_snapshots = DownloadSnapshot.objects.filter(created__lt=snapshot.created)
+    return (
+        earlier_snapshots.filter(
+            created__lte=snapshot.created - TRENDING_WINDOW
+        ).order_by('-created').first()
+        or earlier_snapshots.order_by('created').first()
+    )
+
+
+def get_trending_scores(gutenberg_ids, counts, baseline_ids, baseline_counts):
+    """
+    This gives the trending score of each book in `gutenberg_ids`, which
+    are sorted, from its download count now and in the baseline. Books
+    missing from the baseline had no downloads then.
+    """
+
+    baseline = np.zeros(len(gutenberg_ids), dtype=np.int64)
+    if len(baseline_ids):
+        positions = np.minimum(
+            np.searchsorted(baseline_ids, gutenberg_ids), len(baseline_ids) - 1
+        )
+        found = baseline_ids[positions] == gutenberg_ids
+        baseline[found] = baseline_counts[positions[found]]
+
+    growth = counts - baseline
+    scores = growth / (baseline + GROWTH_SMOOTHING)
+    scores[growth < MIN_GROWTH] = 0
+    return scores
+
+
+def update_trending_books():
+    """
+    This snapshots every book's download count and replaces the trending
+    books, giving how many it stored.
+    """
+
+    snapshot = take_download_snapshot()
+    baseline = get_baseline_snapshot(snapshot)
+    old_snapshots = DownloadSnapshot.objects.filter(
+        created__lt=snapshot.created - DOWNLOAD_HISTORY
+    )
+    if baseline is not None:
+        old_snapshots = old_snapshots.exclude(id=baseline.id)
+    old_snapshots.delete()
+
+    trending_books = []
+    if baseline is not None:
+        gutenberg_ids, counts = unpack_snapshot(snapshot)
+        scores = get_trending_scores(gutenberg_ids, counts, *unpack_snapshot(baseline))
+
+        # Ties go to the more downloaded book.
+        top = np.lexsort((-counts, -scores))[:TRENDING_BOOK_COUNT]
+        top = top[scores[top] > 0]
+        book_ids = dict(
+            Book.objects.filter(
+                gutenberg_id__in=gutenberg_ids[top].tolist()
+            ).values_list('gutenberg_id', 'id')
+        )
+        trending_books = [
+            TrendingBook(book_id=book_ids[gutenberg_id], rank=rank, score=score)
+            for rank, (gutenberg_id, score) in enumerate(
+                zip(gutenberg_ids[top].tolist(), scores[top].tolist())
+            )
+        ]
+
+    with transaction.atomic():
+        TrendingBook.objects.all().delete()
+        TrendingBook.objects.bulk_create(trending_books)
+    return len(trending_books)
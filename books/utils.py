@@ -1,8 +1,28 @@
+from hashlib import blake2b
+from urllib.parse import urlencode
 import defusedxml.ElementTree as parser
+import json
 import re
-
-
+import unicodedata
+
+
+# These articles are left off the start of titles in each language for sorting.
+LEADING_ARTICLES = {
+    'de': {'das', 'der', 'die', 'ein', 'eine'},
+    'en': {'a', 'an', 'the'},
+    'es': {'el', 'la', 'las', 'los', 'un', 'una'},
+    'fr': {'l', 'la', 'le', 'les', 'un', 'une'},
+    'it': {'gli', 'i', 'il', 'l', 'la', 'le', 'lo', 'un', 'una', 'uno'},
+    'nl': {'de', 'een', 'het'},
+    'pt': {'a', 'as', 'o', 'os', 'um', 'uma'},
+}
+TITLE_SORT_KEY_LENGTH = 255
+# The order of these lists of a parsed book doesn't matter.
+UNORDERED_BOOK_FIELDS = ('bookshelves', 'languages', 'subjects', 'summaries')
+# These query parameters are comma-separated lists whose order doesn't matter.
+LIST_QUERY_PARAMETERS = ('copyright', 'fields', 'ids', 'languages', 'omit')
 LINE_BREAK_PATTERN = re.compile(r'[ \t]*[\n\r]+[ \t]*')
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
 NAMESPACES = {
     'dc': 'http://purl.org/dc/terms/',
     'dcam': 'http://purl.org/dc/dcam/',
@@ -150,6 +170,22 @@ def get_book(id, xml_file_path):
     return result
 
 
+def get_content_hash(book):
+    """
+    This gives a hash of a book parsed by `get_book`, which changes when
+    anything shown about it changes. Download counts change nearly every
+    day for nearly every book, so they are left out, but whether there is
+    one isn't, as books without one aren't listed.
+    """
+
+    content = dict(book)
+    content['downloads'] = content['downloads'] is not None
+    for field in UNORDERED_BOOK_FIELDS:
+        content[field] = sorted(content[field], key=str)
+    content_json = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return blake2b(content_json.encode('utf-8'), digest_size=16).hexdigest()
+
+
 def get_person(person_element):
     name = person_element.find('.//{%(pg)s}name' % NAMESPACES)
 
@@ -175,6 +211,60 @@ def get_person(person_element):
     return person
 
 
+def normalize(text):
+    """
+    This simplifies text for matching: case and accents are removed, and
+    runs of punctuation and spaces become single spaces.
+
+    >>> normalize(u'Hugo, Victor -- Les Misérables')
+    u'hugo victor les miserables'
+    """
+
+    text = text.casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return NON_WORD_PATTERN.sub(' ', text).strip()
+
+
+def get_title_sort_key(title, language_codes):
+    """
+    This gives the key that a title is sorted by: the normalized title
+    without a leading article in any of the book's languages.
+
+    >>> get_title_sort_key(u'The Old Man and the Sea', ['en'])
+    u'old man and the sea'
+    >>> get_title_sort_key(u"L'Éducation sentimentale", ['fr'])
+    u'education sentimentale'
+    """
+
+    key = normalize(title or '')
+    first_word, _, rest = key.partition(' ')
+    if rest and any(
+        first_word in LEADING_ARTICLES.get(code, ()) for code in language_codes
+    ):
+        key = rest
+    return key[:TITLE_SORT_KEY_LENGTH]
+
+
+def normalize_query_string(query_params):
+    """
+    This gives a query string that is the same for equivalent query
+    parameters: names are sorted, and so are the items of list parameters.
+
+    >>> normalize_query_string({'languages': 'fr,en', 'copyright': 'true'})
+    'copyright=true&languages=en%2Cfr'
+    """
+
+    items = []
+    for name in sorted(query_params):
+        value = query_params.get(name)
+        if name in LIST_QUERY_PARAMETERS:
+            value = ','.join(sorted(set(value.split(','))))
+        items.append((name, value))
+    return urlencode(items)
+
+
 def safe_unicode(arg, *args, **kwargs):
     """ Coerce argument to Unicode if it's not already. """
     return arg if isinstance(arg, str) else str(arg, *args, **kwargs)
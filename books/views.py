@@ -1,101 +1,567 @@
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import close_old_connections
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+from django.http import Http404, HttpResponse
+from django.utils.cache import add_never_cache_headers
+from django.utils.functional import cached_property
 
-from rest_framework import exceptions as drf_exceptions, viewsets
+from rest_framework import exceptions as drf_exceptions, mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
+from .autocomplete import get_suggestions
+from .catalog import get_catalog_version
+from .executors import async_view_executor
+from .facets import FILTER_PARAMETERS, get_catalog_facets, get_facet_counts
+from .guardrails import check_query_cost, statement_time_limit
 from .models import *
+from .pages import CachedPage, cache_page, get_cached_page, get_page_cache_key
+from .profiling import profile_phase, profile_request
+from .related import RELATED_BOOK_COUNT
+from .sampling import get_eligible_ids, pick_random_ids
 from .serializers import *
+from .snapshots import close_outdated_connections
+from .throttling import RateLimitHeadersMixin
+from .utils import normalize
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class AuthorPagination(CursorPagination):
+    """
+    This pages through people by sort name. Each page starts where the last
+    one ended in the index, however deep it is.
+    """
+
+    ordering = ('sort_name', 'id')
+
+
+class CatalogChangePagination(CursorPagination):
+    """
+    This pages through catalog changes in the order they were recorded.
+    Pages of changes alone are large, as each is small, and pages with
+    documents are the size of book list pages.
+    """
+
+    ordering = ('id',)
+    page_size = 1000
+
+    def get_page_size(self, request):
+        if request.GET.get('documents') == 'true':
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        return self.page_size
+
+
+# This is the most books that can be picked at random at once.
+MAX_RANDOM_BOOKS = 32
+
+
+class ProfiledPaginator(Paginator):
+    @cached_property
+    def count(self):
+        with profile_phase('count'):
+            return super().count
+
+
+class BookPagination(PageNumberPagination):
+    django_paginator_class = ProfiledPaginator
+
+    def paginate_cached_page(self, request, count):
+        """
+        This sets up the links for a cached page of a list of `count` books,
+        without querying the list.
+        """
+
+        paginator = self.django_paginator_class((), self.get_page_size(request))
+        paginator.count = count
+        self.page = paginator.page(self.get_page_number(request, paginator))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+
+
+class AuthorViewSet(RateLimitHeadersMixin, viewsets.ReadOnlyModelViewSet):
+    """ This is an API endpoint that allows authors and other contributors to be viewed. """
+
+    queryset = Person.objects.filter(
+        Q(authored_count__gt=0) | Q(edited_count__gt=0) | Q(translated_count__gt=0)
+    )
+
+    serializer_class = AuthorSerializer
+    pagination_class = AuthorPagination
+
+    def get_queryset(self):
+        queryset = self.queryset
+
+        name = self.request.GET.get('name')
+        if name is not None:
+            # This is a range of sort names, so it can use their index.
+            prefix = normalize(name)[:128]
+            queryset = queryset.filter(
+                sort_name__gte=prefix,
+                sort_name__lt=prefix + '\U0010ffff'
+            )
+
+        return queryset
+
+
+class BookViewSet(RateLimitHeadersMixin, viewsets.ModelViewSet):
     """ This is an API endpoint that allows books to be viewed. """
 
     lookup_field = 'gutenberg_id'
 
-    queryset = Book.objects.exclude(download_count__isnull=True)
-    queryset = queryset.exclude(title__isnull=True)
+    queryset = Book.objects.listed()
 
     serializer_class = BookSerializer
+    pagination_class = BookPagination
+
+    def dispatch(self, request, *args, **kwargs):
+        with profile_request() as profile:
+            response = super().dispatch(request, *args, **kwargs)
+            if profile is not None:
+                if hasattr(response, 'render'):
+                    with profile_phase('render'):
+                        response.render()
+                response['Server-Timing'] = profile.get_server_timing()
+                profile.log_if_slow(request, response)
+        return response
+
+    def get_selected_field_names(self):
+        if not hasattr(self, '_selected_field_names'):
+            self._selected_field_names = (
+                self.serializer_class.get_selected_field_names(self.request.GET)
+            )
+        return self._selected_field_names
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['field_names'] = self.get_selected_field_names()
+        return context
 
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = self.queryset.prefetch_related(
+            *self.serializer_class.get_prefetch_lookups(
+                self.get_selected_field_names()
+            )
+        )
 
         sort = self.request.GET.get('sort')
+        search_string = self.request.GET.get('search')
         if sort == 'ascending':
             queryset = queryset.order_by('id')
         elif sort == 'descending':
             queryset = queryset.order_by('-id')
+        elif sort == 'title':
+            queryset = queryset.order_by('title_sort', 'id')
+        elif sort == 'author':
+            queryset = queryset.order_by('author_sort', 'title_sort', 'id')
+        elif sort == 'relevance' and search_string is not None:
+            queryset = queryset.annotate(
+                relevance=get_search_relevance(search_string)
+            ).order_by('-relevance', '-download_count', 'id')
         else:
             queryset = queryset.order_by('-download_count')
 
-        author_year_end = self.request.GET.get('author_year_end')
+        return filter_books(queryset, self.request.GET)
+
+    def get_page_books(self, ids):
+        """ This looks up a page's books by ID, with their related data. """
+
+        books = self.queryset.prefetch_related(
+            *self.serializer_class.get_prefetch_lookups(
+                self.get_selected_field_names()
+            )
+        ).in_bulk(ids)
+        # Books can be unlisted after their IDs are cached or ranked, so
+        # those that have gone are left out.
+        return [books[id] for id in ids if id in books]
+
+    @action(detail=False)
+    def autocomplete(self, request):
+        """
+        This suggests up to `limit` titles and author names with a word
+        starting with the text in `q`, most downloaded first.
+        """
+
         try:
-            author_year_end = int(author_year_end)
-        except:
-            author_year_end = None
-        if author_year_end is not None:
-            queryset = queryset.filter(
-                Q(authors__birth_year__lte=author_year_end) |
-                Q(authors__death_year__lte=author_year_end)
+            limit = int(request.GET.get('limit', 10))
+        except ValueError:
+            raise drf_exceptions.ParseError('The limit must be a whole number.')
+
+        return Response({
+            'results': get_suggestions(request.GET.get('q', ''), limit),
+        })
+
+    @action(detail=False)
+    def facets(self, request):
+        """
+        This gives the number of books for each language, bookshelf,
+        copyright status, and media type, among the books that would be
+        listed with the same filter parameters.
+        """
+
+        filtered = any(
+            parameter in request.GET for parameter in FILTER_PARAMETERS
+        )
+        counts = None if filtered else get_catalog_facets()
+        if not counts:
+            check_query_cost(request.GET)
+            with statement_time_limit():
+                counts = get_facet_counts(
+                    filter_books(self.queryset, request.GET).order_by().values('id')
+                )
+        return Response(counts)
+
+    @action(detail=False)
+    def random(self, request):
+        """
+        This gives up to `limit` random books, optionally only those allowed
+        by the `copyright`, `languages`, and `mime_type` parameters.
+        """
+
+        try:
+            limit = int(request.GET.get('limit', 1))
+        except ValueError:
+            raise drf_exceptions.ParseError('The limit must be a whole number.')
+        limit = max(1, min(limit, MAX_RANDOM_BOOKS))
+
+        with statement_time_limit():
+            ids = get_eligible_ids(
+                request.GET,
+                lambda filters: filter_books(self.queryset, filters).order_by(
+                    'id'
+                ).values_list('id', flat=True).iterator()
             )
+            books = self.get_page_books(pick_random_ids(ids, limit))
+            response = Response({
+                'count': len(ids),
+                'results': self.get_serializer(books, many=True).data,
+            })
+
+        add_never_cache_headers(response)
+        return response
+
+    @action(detail=True)
+    def related(self, request, gutenberg_id=None):
+        """
+        This gives up to `limit` books most like the given one, by the
+        authors, bookshelves, and subjects they share.
+        """
 
-        author_year_start = self.request.GET.get('author_year_start')
         try:
-            author_year_start = int(author_year_start)
-        except:
-            author_year_start = None
-        if author_year_start is not None:
-            queryset = queryset.filter(
-                Q(authors__birth_year__gte=author_year_start) |
-                Q(authors__death_year__gte=author_year_start)
+            limit = int(request.GET.get('limit', RELATED_BOOK_COUNT))
+        except ValueError:
+            raise drf_exceptions.ParseError('The limit must be a whole number.')
+        limit = max(1, min(limit, RELATED_BOOK_COUNT))
+
+        # This 404s on IDs that aren't numbers, as `get_object()` does.
+        try:
+            gutenberg_id = int(gutenberg_id)
+        except ValueError:
+            raise Http404
+
+        ids = list(
+            RelatedBook.objects.filter(
+                book__gutenberg_id=gutenberg_id
+            ).order_by('rank').values_list('related_id', flat=True)[:limit]
+        )
+        if not ids and not self.queryset.filter(gutenberg_id=gutenberg_id).exists():
+            raise Http404
+
+        books = self.get_page_books(ids)
+        return Response({
+            'count': len(books),
+            'results': self.get_serializer(books, many=True).data,
+        })
+
+    @action(detail=False)
+    def trending(self, request):
+        """
+        This lists the books whose downloads have grown the most lately,
+        fastest first, as found by `books.trending` after each catalog
+        update. They can be narrowed down like any list of books.
+        """
+
+        check_query_cost(request.GET)
+        with statement_time_limit():
+            queryset = filter_books(
+                self.queryset.filter(trending__isnull=False), request.GET
+            ).order_by('trending__rank')
+            ids = self.paginate_queryset(queryset.values_list('id', flat=True))
+            page = self.get_page_books(ids)
+            return self.get_paginated_response(
+                self.get_serializer(page, many=True).data
             )
 
-        copyright_parameter = self.request.GET.get('copyright')
-        if copyright_parameter is not None:
-            copyright_strings = copyright_parameter.split(',')
-            copyright_values = set()
-            for copyright_string in copyright_strings:
-                if copyright_string == 'true':
-                    copyright_values.add(True)
-                elif copyright_string == 'false':
-                    copyright_values.add(False)
-                elif copyright_string == 'null':
-                    copyright_values.add(None)
-            for value in [True, False, None]:
-                if value not in copyright_values:
-                    queryset = queryset.exclude(copyright=value)
-
-        id_string = self.request.GET.get('ids')
-        if id_string is not None:
-            ids = id_string.split(',')
-
-            try:
-                ids = [int(id) for id in ids]
-            except ValueError:
-                pass
-            else:
-                queryset = queryset.filter(gutenberg_id__in=ids)
+    def list(self, request, *args, **kwargs):
+        check_query_cost(request.GET)
 
-        language_string = self.request.GET.get('languages')
-        if language_string is not None:
-            language_codes = [code.lower() for code in language_string.split(',')]
-            queryset = queryset.filter(languages__code__in=language_codes)
+        cached_page = None
+        cache_key = get_page_cache_key(request.GET)
+        if cache_key is not None:
+            version = get_catalog_version()
+            with profile_phase('cache'):
+                cached_page = get_cached_page(cache_key, version)
 
-        mime_type = self.request.GET.get('mime_type')
-        if mime_type is not None:
-            queryset = queryset.filter(format__mime_type__startswith=mime_type)
+        with statement_time_limit():
+            page = None
+            if cached_page is not None and cached_page.data is None:
+                with profile_phase('fetch'):
+                    page = self.get_page_books(cached_page.ids)
+                if len(page) < len(cached_page.ids):
+                    # Some of the page's books have been unlisted since it
+                    # was cached, so its count and links are wrong as well.
+                    cached_page = page = None
 
-        search_string = self.request.GET.get('search')
-        if search_string is not None:
-            search_terms = search_string.split(' ')
-            for term in search_terms[:32]:
-                queryset = queryset.filter(
-                    Q(authors__name__icontains=term) | Q(title__icontains=term)
+            if cached_page is None:
+                with profile_phase('filter'):
+                    queryset = self.filter_queryset(self.get_queryset())
+                with profile_phase('fetch'):
+                    # Only the sorted IDs are paged through, however deep the
+                    # page, and then just that page's rows are looked up.
+                    ids = self.paginate_queryset(
+                        queryset.prefetch_related(None).values_list('id', flat=True)
+                    )
+                data = None
+            else:
+                self.paginator.paginate_cached_page(request, cached_page.count)
+                ids = cached_page.ids
+                data = cached_page.data
+
+            if data is None:
+                if page is None:
+                    with profile_phase('fetch'):
+                        page = self.get_page_books(ids)
+                with profile_phase('serialize'):
+                    data = self.get_serializer(page, many=True).data
+
+            if cache_key is not None and cached_page is None:
+                cache_page(
+                    cache_key,
+                    version,
+                    CachedPage(self.paginator.page.paginator.count, ids, data)
                 )
+            return self.get_paginated_response(data)
+
+
+class CatalogChangeViewSet(
+    RateLimitHeadersMixin, mixins.ListModelMixin, viewsets.GenericViewSet
+):
+    """
+    This is an API endpoint that lists the books created, updated, or
+    deleted by catalog updates after the `since` version, for mirrors to
+    sync. With `documents=true`, each change comes with the current
+    document of its book.
+    """
+
+    serializer_class = CatalogChangeSerializer
+    pagination_class = CatalogChangePagination
+
+    def get_queryset(self):
+        try:
+            since = int(self.request.GET.get('since', 0))
+        except ValueError:
+            raise drf_exceptions.ParseError('The since version must be a whole number.')
+        return CatalogChange.objects.filter(version_id__gt=since)
+
+    def list(self, request, *args, **kwargs):
+        changes = self.paginate_queryset(self.get_queryset())
+        data = self.get_serializer(changes, many=True).data
+
+        if request.GET.get('documents') == 'true':
+            gutenberg_ids = [
+                change.gutenberg_id for change in changes
+                if change.change != CatalogChange.DELETED
+            ]
+            books = BookViewSet.queryset.prefetch_related(
+                *BookSerializer.get_prefetch_lookups(BookSerializer.Meta.fields)
+            ).in_bulk(gutenberg_ids, field_name='gutenberg_id')
+            for change, item in zip(changes, data):
+                book = books.get(change.gutenberg_id)
+                item['book'] = None if book is None else BookSerializer(book).data
+
+        return self.get_paginated_response(data)
+
+
+def get_search_relevance(search_string):
+    """
+    This scores how well books match a search. Each term scores 2 if it's
+    in the title and 1 if it's in an author's name, and a title with all
+    of the terms together scores 2 more.
+    """
+
+    search_terms = [term for term in search_string.split(' ')[:32] if term]
+    relevance = Value(0)
+    for term in search_terms:
+        relevance += Case(
+            When(title__icontains=term, then=Value(2)), default=Value(0)
+        )
+        relevance += Case(
+            When(
+                Exists(Book.authors.through.objects.filter(
+                    book_id=OuterRef('pk'),
+                    person__name__icontains=term
+                )),
+                then=Value(1)
+            ),
+            default=Value(0)
+        )
+    if len(search_terms) > 1:
+        relevance += Case(
+            When(title__icontains=' '.join(search_terms), then=Value(2)),
+            default=Value(0)
+        )
+    return relevance
 
-        topic = self.request.GET.get('topic')
-        if topic is not None:
+
+def filter_books(queryset, query_params):
+    """ This narrows down a queryset of books with list query parameters. """
+
+    author_year_end = query_params.get('author_year_end')
+    try:
+        author_year_end = int(author_year_end)
+    except:
+        author_year_end = None
+    if author_year_end is not None:
+        # Some author was born or died by the end year.
+        queryset = queryset.filter(author_year_min__lte=author_year_end)
+
+    author_year_start = query_params.get('author_year_start')
+    try:
+        author_year_start = int(author_year_start)
+    except:
+        author_year_start = None
+    if author_year_start is not None:
+        # Some author was born or died in or after the start year.
+        queryset = queryset.filter(author_year_max__gte=author_year_start)
+
+    copyright_parameter = query_params.get('copyright')
+    if copyright_parameter is not None:
+        copyright_strings = copyright_parameter.split(',')
+        copyright_values = set()
+        for copyright_string in copyright_strings:
+            if copyright_string == 'true':
+                copyright_values.add(True)
+            elif copyright_string == 'false':
+                copyright_values.add(False)
+            elif copyright_string == 'null':
+                copyright_values.add(None)
+        for value in [True, False, None]:
+            if value not in copyright_values:
+                queryset = queryset.exclude(copyright=value)
+
+    id_string = query_params.get('ids')
+    if id_string is not None:
+        ids = id_string.split(',')
+
+        try:
+            ids = [int(id) for id in ids]
+        except ValueError:
+            pass
+        else:
+            queryset = queryset.filter(gutenberg_id__in=ids)
+
+    language_string = query_params.get('languages')
+    if language_string is not None:
+        language_codes = [code.lower() for code in language_string.split(',')]
+        queryset = queryset.filter(languages__code__in=language_codes)
+
+    mime_type = query_params.get('mime_type')
+    if mime_type is not None:
+        # The few matching MIME types are found first, so formats are
+        # filtered by their IDs instead of being joined to their names.
+        queryset = queryset.filter(
+            format__mime_type__in=MimeType.objects.filter(name__startswith=mime_type)
+        )
+
+    search_string = query_params.get('search')
+    if search_string is not None:
+        search_terms = search_string.split(' ')
+        for term in search_terms[:32]:
             queryset = queryset.filter(
-                Q(bookshelves__name__icontains=topic) | Q(subjects__name__icontains=topic)
+                Q(authors__name__icontains=term) | Q(title__icontains=term)
             )
 
-        return queryset.distinct()
+    topic = query_params.get('topic')
+    if topic is not None:
+        queryset = queryset.filter(
+            Q(bookshelves__name__icontains=topic) | Q(subjects__name__icontains=topic)
+        )
+
+    return queryset.distinct()
+
+
+def ready(request):
+    """
+    This tells probes that the server is taking requests. It doesn't touch
+    the database, so it answers quickly however busy that is.
+    """
+
+    return HttpResponse('ok', content_type='text/plain')
+
+
+def as_async_view(view):
+    """
+    This makes an async version of a synchronous view. The view and its
+    rendering run in a thread pool, so a server's event loop can hold many
+    slow connections while queries for others are running.
+    """
+
+    def run_view(request, *args, **kwargs):
+        # Each pool thread has its own connection, which Django's request
+        # signals don't manage.
+        close_old_connections()
+        if settings.SNAPSHOT_MODE == 'replica':
+            close_outdated_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    run_view_in_pool = sync_to_async(
+        run_view,
+        thread_sensitive=False,
+        executor=async_view_executor
+    )
+
+    async def async_view(request, *args, **kwargs):
+        return await run_view_in_pool(request, *args, **kwargs)
+
+    async_view.csrf_exempt = getattr(view, 'csrf_exempt', False)
+    return async_view
+
+
+async_author_list = as_async_view(
+    AuthorViewSet.as_view({'get': 'list'})
+)
+async_catalog_change_list = as_async_view(
+    CatalogChangeViewSet.as_view({'get': 'list'})
+)
+async_book_list = as_async_view(
+    BookViewSet.as_view({'get': 'list', 'post': 'create'})
+)
+async_book_autocomplete = as_async_view(
+    BookViewSet.as_view({'get': 'autocomplete'}, detail=False)
+)
+async_book_facets = as_async_view(
+    BookViewSet.as_view({'get': 'facets'}, detail=False)
+)
+async_book_random = as_async_view(
+    BookViewSet.as_view({'get': 'random'}, detail=False)
+)
+async_book_related = as_async_view(
+    BookViewSet.as_view({'get': 'related'}, detail=True)
+)
+async_book_trending = as_async_view(
+    BookViewSet.as_view({'get': 'trending'}, detail=False)
+)
+async_book_detail = as_async_view(BookViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}))
@@ -0,0 +1,130 @@
+"""
+This gets server workers ready before they take requests, so that clients
+don't pay for a worker's first requests. With `preload_app` in
+`gunicorn.conf.py`, the app's modules and the autocomplete index are loaded
+once, before workers are forked, and shared by them. Then each worker opens
+its database connection, reads the hot tables and indexes into the page
+cache, and runs the common book list queries once, so SQLite's statements
+are compiled and the rows they need are in memory.
+"""
+
+from time import perf_counter
+import logging
+import os
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.test import RequestFactory
+from django.urls import get_resolver
+
+from .autocomplete import get_index
+from .views import BookViewSet
+
+
+# These are the most requested kinds of book list, shaped like `loadtest`'s.
+WARM_UP_PATHS = [
+    '/books/',
+    '/books/?page=2',
+    '/books/?languages=en',
+    '/books/?search=history',
+    '/books/?mime_type=text%2Fhtml',
+    '/books/?author_year_start=1800&author_year_end=1899',
+    '/books/?ids=1,2,3',
+]
+
+# The indexes of these tables are read whole, for SQLite.
+HOT_TABLES = [
+    'books_book',
+    'books_book_authors',
+    'books_book_bookshelves',
+    'books_book_languages',
+    'books_bookshelf',
+    'books_format',
+    'books_language',
+    'books_person',
+]
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    """
+    This loads everything workers share before they are forked. It leaves
+    no database connection open, as forked processes mustn't share one.
+    """
+
+    # This imports the URLconf, and with it the views and serializers.
+    get_resolver().url_patterns
+    try:
+        get_index()
+    except DatabaseError:
+        logger.exception('The autocomplete index could not be preloaded.')
+    finally:
+        connections.close_all()
+
+
+def warm_database_file():
+    """ This has the OS read ahead the SQLite file and each hot index. """
+
+    if hasattr(os, 'posix_fadvise'):
+        # The file's path is asked for, as the database may be named by a URI.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT file FROM pragma_database_list WHERE name = 'main'")
+            path, = cursor.fetchone()
+        file = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(file, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(file)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name IN (%s)" % ', '.join(['%s'] * len(HOT_TABLES)),
+            HOT_TABLES
+        )
+        for table, index in cursor.fetchall():
+            cursor.execute(
+                'SELECT COUNT(*) FROM %s INDEXED BY %s' % (
+                    connection.ops.quote_name(table),
+                    connection.ops.quote_name(index)
+                )
+            )
+
+
+def run_common_queries():
+    host = next(
+        (host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'),
+        'localhost'
+    )
+    factory = RequestFactory(HTTP_HOST=host)
+    # Warm-up requests don't use up anyone's rate limit.
+    book_list = BookViewSet.as_view({'get': 'list'}, throttle_classes=[])
+    for path in WARM_UP_PATHS:
+        book_list(factory.get(path)).render()
+
+
+def warm_up():
+    """ This readies a newly forked worker, logging how long it took. """
+
+    start = perf_counter()
+    try:
+        connection.ensure_connection()
+        if connection.vendor == 'sqlite':
+            warm_database_file()
+        run_common_queries()
+        get_index()
+    except Exception:
+        # A worker that couldn't warm up can still serve.
+        logger.exception('Warming up worker %d failed.', os.getpid())
+    else:
+        logger.info(
+            'Worker %d warmed up in %.2f seconds.', os.getpid(), perf_counter() - start
+        )
+    finally:
+        # Sync workers serve requests on this thread, so the connection is
+        # kept for them, with its page cache and compiled statements. On
+        # replicas, it could hold a replaced snapshot open until the first
+        # request, so it is closed there.
+        if settings.SNAPSHOT_MODE == 'replica':
+            connection.close()
@@ -9,48 +9,41 @@ echo "Gutendex Container Starting"
 echo "=========================================="
 
 # =============================================================================
-# STEP 1: Check for pre-built database bundled in image
+# STEP 1: Check what still needs doing
 # =============================================================================
-echo "[1/4] Checking for pre-built database..."
+# This unpacks the pre-built database bundled in the image if there's no
+# database yet, and checks migrations, the catalog version, and static files
+# without starting Django, so restarts with nothing to do are quick.
+echo "[1/4] Checking database, catalog, and static files..."
 
 PREBUILT_DB="/app/prebuilt/gutendex.db.gz"
 
-if [ -f "$PREBUILT_DB" ] && [ ! -f "$DATABASE_PATH" ]; then
-    echo "Found pre-built database in image!"
-    echo "Extracting to $DATABASE_PATH..."
-    gunzip -c "$PREBUILT_DB" > "$DATABASE_PATH"
-    echo "Pre-built database ready!"
-elif [ -f "$PREBUILT_DB" ]; then
-    echo "Pre-built database available, but database already exists."
-elif [ -f "$DATABASE_PATH" ]; then
-    echo "Using existing database at $DATABASE_PATH"
-else
-    echo "No pre-built database found. Will download if needed."
-fi
+BOOT_STATE=$(python -m gutendex.boot --prebuilt "$PREBUILT_DB") \
+    || BOOT_STATE="NEEDS_MIGRATE=1 BOOK_COUNT=0 NEEDS_STATIC=1"
+eval "$BOOT_STATE"
 
 # =============================================================================
 # STEP 2: Run migrations
 # =============================================================================
-echo "[2/4] Running database migrations..."
-python manage.py migrate --noinput
+if [ "$NEEDS_MIGRATE" = "1" ]; then
+    echo "[2/4] Running database migrations..."
+    python manage.py migrate --noinput
+else
+    echo "[2/4] Database migrations are up to date."
+fi
 
 # =============================================================================
 # STEP 3: Check catalog completeness
 # =============================================================================
 echo "[3/4] Checking catalog status..."
-BOOK_COUNT=$(python -c "
-import os
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gutendex.settings')
-import django
-django.setup()
-from books.models import Book
-print(Book.objects.count())
-" 2>/dev/null || echo "0")
-
-echo "Current book count: $BOOK_COUNT"
 
+# Replicas serve snapshots published by the catalog updater (see
+# books/snapshots.py), so they have no catalog of their own to fill.
+if [ "$SNAPSHOT_MODE" = "replica" ]; then
+    echo "Serving catalog snapshots from $SNAPSHOT_DIR."
 # Need at least 50,000 books for a complete catalog
-if [ "$BOOK_COUNT" -lt 50000 ]; then
+elif [ "$BOOK_COUNT" -lt 50000 ]; then
+    echo "Current book count: $BOOK_COUNT"
     echo ""
     echo "Catalog incomplete ($BOOK_COUNT books, need 50,000+)"
     echo ""
@@ -83,12 +76,18 @@ if [ "$BOOK_COUNT" -lt 50000 ]; then
         ATTEMPT=$((ATTEMPT + 1))
     done
 else
+    echo "Current book count: $BOOK_COUNT"
     echo "Catalog complete ($BOOK_COUNT books). Skipping download."
 fi
 
 # Collect static files
-echo "[4/4] Collecting static files..."
-python manage.py collectstatic --noinput
+if [ "$NEEDS_STATIC" = "1" ]; then
+    echo "[4/4] Collecting static files..."
+    python manage.py collectstatic --noinput
+    python -m gutendex.boot --stamp-static
+else
+    echo "[4/4] Static files are up to date."
+fi
 
 echo "=========================================="
 echo "Initialization complete! Starting server..."
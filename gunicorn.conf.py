@@ -0,0 +1,53 @@
+"""
+These are gunicorn settings and server hooks, used along with the command
+line options in the Dockerfile. The app is loaded before workers are
+forked, and each worker warms up before taking requests (see
+`books.warmup`). Replicas start on the newest catalog snapshot, and each
+worker watches for newer ones (see `books.snapshots`). Worker processes
+share Prometheus metrics through files in PROMETHEUS_MULTIPROC_DIR, which
+is emptied whenever the server starts.
+"""
+
+import os
+
+from prometheus_client import multiprocess
+
+
+preload_app = True
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    from django.conf import settings
+
+    if settings.SNAPSHOT_MODE == 'replica':
+        from books.snapshots import wait_for_snapshot
+        wait_for_snapshot()
+
+    if settings.WARM_UP_WORKERS:
+        from books.warmup import preload
+        preload()
+
+
+def post_fork(server, worker):
+    from django.conf import settings
+
+    if settings.SNAPSHOT_MODE == 'replica':
+        from books.snapshots import start_watching
+        start_watching()
+
+    if settings.WARM_UP_WORKERS:
+        from books.warmup import warm_up
+        warm_up()
@@ -0,0 +1,19 @@
+"""
+ASGI config for gutendex project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Book list and detail requests are handled by async views that run their
+queries in a thread pool (see ``books.views.as_async_view``).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gutendex.settings")
+os.environ.setdefault("ASYNC_API", "true")
+
+application = get_asgi_application()
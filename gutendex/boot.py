@@ -0,0 +1,226 @@
+"""
+This works out which start-up steps a container still has to take, with a
+few cheap reads instead of Django management commands, so that restarts
+with a ready database and static files go straight to serving. It doesn't
+call `django.setup()`:
+
+- The prebuilt database is unpacked only if there is no database yet. It is
+  streamed to a temporary file and renamed into place, so an interrupted
+  unpacking never leaves a partial database behind.
+- Migrations are due if any migration file of an installed app isn't
+  recorded in the `django_migrations` table.
+- The number of books comes from the latest catalog version, not a count
+  of the book table.
+- Static files are due unless STATIC_ROOT has a stamp matching the static
+  files of the installed apps, written after they were last collected.
+- Replicas, which serve published catalog snapshots, have no database of
+  their own, so nothing is unpacked or migrated for them.
+
+Run with `python -m gutendex.boot`, it prints NEEDS_MIGRATE, BOOK_COUNT,
+and NEEDS_STATIC shell variables for `docker-entrypoint.sh`.
+"""
+
+from hashlib import sha256
+import argparse
+import gzip
+import importlib.util
+import os
+import shutil
+import sqlite3
+import sys
+
+from gutendex import settings
+
+
+DEFAULT_PREBUILT_PATH = '/app/prebuilt/gutendex.db.gz'
+
+STATIC_STAMP_NAME = '.collected'
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def log(*args):
+    print(*args, file=sys.stderr)
+
+
+def restore_prebuilt_database(prebuilt_path, database_path):
+    """
+    This unpacks the gzipped prebuilt database to `database_path` if there
+    is no database there, giving whether it did.
+    """
+
+    if not os.path.exists(prebuilt_path):
+        return False
+    if os.path.exists(database_path) and os.path.getsize(database_path) > 0:
+        return False
+
+    temporary_path = database_path + '.unpacking'
+    try:
+        with gzip.open(prebuilt_path, 'rb') as source:
+            with open(temporary_path, 'wb') as destination:
+                shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
+                destination.flush()
+                os.fsync(destination.fileno())
+        os.replace(temporary_path, database_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return True
+
+
+def connect():
+    """ This opens the database read-only, or gives None if it doesn't exist. """
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.postgresql':
+        import psycopg2
+
+        connection = psycopg2.connect(
+            dbname=database['NAME'],
+            user=database['USER'],
+            password=database['PASSWORD'],
+            host=database['HOST'],
+            port=database['PORT'],
+            connect_timeout=10
+        )
+        # A failed query shouldn't spoil the ones after it.
+        connection.autocommit = True
+        return connection
+
+    if not os.path.exists(database['NAME']):
+        return None
+    return sqlite3.connect('file:%s?mode=ro' % database['NAME'], uri=True)
+
+
+def query(connection, sql):
+    """ This gives the rows of `sql`, or None if it fails, as for a missing table. """
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql)
+        return cursor.fetchall()
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+
+def get_app_directory(app):
+    """
+    This gives the directory of an installed app's package without
+    importing the package, which would need Django to be set up.
+    """
+
+    parts = app.split('.')
+    spec = importlib.util.find_spec(parts[0])
+    return os.path.join(os.path.dirname(spec.origin), *parts[1:])
+
+
+def get_migration_names():
+    names = set()
+    for app in settings.INSTALLED_APPS:
+        directory = os.path.join(get_app_directory(app), 'migrations')
+        if not os.path.isdir(directory):
+            continue
+        label = app.split('.')[-1]
+        for file_name in os.listdir(directory):
+            name, extension = os.path.splitext(file_name)
+            if extension == '.py' and name[0] not in '_~':
+                names.add((label, name))
+    return names
+
+
+def needs_migrate(connection):
+    if connection is None:
+        return True
+    applied = query(connection, 'SELECT app, name FROM django_migrations')
+    return applied is None or bool(get_migration_names() - set(applied))
+
+
+def get_book_count(connection):
+    if connection is None:
+        return 0
+    rows = query(
+        connection,
+        'SELECT book_count FROM books_catalogversion ORDER BY id DESC LIMIT 1'
+    )
+    if not rows:
+        # Catalogs loaded before catalog versions were recorded are counted.
+        rows = query(connection, 'SELECT COUNT(*) FROM books_book')
+    return rows[0][0] if rows else 0
+
+
+def get_static_fingerprint():
+    """ This hashes the names, sizes, and times of all static source files. """
+
+    directories = list(settings.STATICFILES_DIRS) + [
+        os.path.join(get_app_directory(app), 'static')
+        for app in settings.INSTALLED_APPS
+    ]
+
+    fingerprint = sha256(settings.STATICFILES_STORAGE.encode())
+    for directory in directories:
+        for root, directory_names, file_names in os.walk(directory):
+            directory_names.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(root, file_name)
+                stat = os.stat(path)
+                fingerprint.update(
+                    ('%s %d %d\n' % (path, stat.st_size, stat.st_mtime_ns)).encode()
+                )
+    return fingerprint.hexdigest()
+
+
+def needs_static():
+    stamp_path = os.path.join(settings.STATIC_ROOT, STATIC_STAMP_NAME)
+    try:
+        with open(stamp_path) as stamp_file:
+            return stamp_file.read().strip() != get_static_fingerprint()
+    except FileNotFoundError:
+        return True
+
+
+def stamp_static():
+    stamp_path = os.path.join(settings.STATIC_ROOT, STATIC_STAMP_NAME)
+    with open(stamp_path, 'w') as stamp_file:
+        stamp_file.write(get_static_fingerprint() + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--prebuilt', default=DEFAULT_PREBUILT_PATH)
+    parser.add_argument(
+        '--stamp-static',
+        action='store_true',
+        help='Record that the static files have just been collected.'
+    )
+    args = parser.parse_args()
+
+    if args.stamp_static:
+        stamp_static()
+        return
+
+    if settings.SNAPSHOT_MODE == 'replica':
+        print('NEEDS_MIGRATE=0')
+        print('BOOK_COUNT=0')
+        print('NEEDS_STATIC=%d' % needs_static())
+        return
+
+    if settings.DATABASE_ENGINE == 'sqlite':
+        database_path = settings.DATABASES['default']['NAME']
+        if restore_prebuilt_database(args.prebuilt, database_path):
+            log('Unpacked the prebuilt database to', database_path)
+
+    connection = connect()
+    try:
+        print('NEEDS_MIGRATE=%d' % needs_migrate(connection))
+        print('BOOK_COUNT=%d' % get_book_count(connection))
+    finally:
+        if connection is not None:
+            connection.close()
+    print('NEEDS_STATIC=%d' % needs_static())
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.10/ref/settings/
 """
 
+from django.core.exceptions import ImproperlyConfigured
 import environ
 import os
 
@@ -23,13 +24,45 @@ env = environ.Env(
     ADMIN_EMAILS=(list, []),
     ADMIN_NAMES=(list, []),
     ALLOWED_HOSTS=(list, ['*']),
+    API_KEYS=(list, []),
+    ASYNC_API=(bool, False),
+    ASYNC_API_THREADS=(int, 16),
     DEBUG=(bool, False),
     MANAGER_EMAILS=(list, []),
     MANAGER_NAMES=(list, []),
     SECRET_KEY=(str, 'django-insecure-default-key-change-in-production'),
     STATIC_ROOT=(str, '/app/staticfiles'),
     MEDIA_ROOT=(str, '/app/media'),
+    DATABASE_ENGINE=(str, 'sqlite'),
+    DATABASE_HOST=(str, '127.0.0.1'),
+    DATABASE_NAME=(str, 'gutendex'),
+    DATABASE_PASSWORD=(str, ''),
     DATABASE_PATH=(str, '/app/data/gutendex.db'),
+    DATABASE_POOLER=(bool, False),
+    DATABASE_PORT=(str, '5432'),
+    DATABASE_USER=(str, 'gutendex'),
+    DATABASE_QUERY_ONLY=(bool, False),
+    DATABASE_MMAP_SIZE=(int, 1024 * 1024 * 1024),
+    DATABASE_CACHE_SIZE=(int, -32 * 1024),
+    CACHE_DIR=(str, '/app/cache'),
+    PAGE_CACHE_BODIES=(bool, True),
+    PAGE_CACHE_MAX_PAGE=(int, 3),
+    PROFILE_REQUESTS=(bool, False),
+    QUERY_COST_LIMIT=(int, 40),
+    QUERY_TIME_LIMIT=(float, 5.0),
+    SLOW_REQUEST_LOG=(str, ''),
+    SLOW_REQUEST_THRESHOLD=(float, 1.0),
+    SNAPSHOT_CHECK_INTERVAL=(float, 30.0),
+    SNAPSHOT_DIR=(str, ''),
+    SNAPSHOT_KEEP=(int, 3),
+    SNAPSHOT_MODE=(str, ''),
+    THROTTLE_DB_PATH=(str, ''),
+    THROTTLE_PROXY_COUNT=(int, 0),
+    THROTTLE_RATE=(str, ''),
+    THROTTLE_KEY_RATE=(str, ''),
+    THROTTLE_SEARCH_RATE=(str, ''),
+    THROTTLE_SEARCH_KEY_RATE=(str, ''),
+    WARM_UP_WORKERS=(bool, True),
     CATALOG_DIR=(str, os.path.join(BASE_DIR, 'catalog_files')),
     EMAIL_HOST=(str, ''),
     EMAIL_HOST_ADDRESS=(str, ''),
@@ -76,7 +109,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Serve static files in production
+    'books.metrics.metrics_middleware',  # Record Prometheus metrics
+    'books.middleware.StaticFilesMiddleware',  # Serve static files in production
+    'books.middleware.CompressionMiddleware',  # Compress API responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -106,27 +141,124 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'gutendex.wsgi.application'
 
+# When served with ASGI (`gutendex.asgi`), book lists and details are handled
+# by async views that run their queries in a pool of ASYNC_API_THREADS
+# threads, so slow clients don't tie up a worker.
+ASYNC_API = env('ASYNC_API')
+ASYNC_API_THREADS = env('ASYNC_API_THREADS')
+
 
 # Database
-# https://docs.djangoproject.com/en/1.10/ref/settings/#databases
-# Using SQLite for simplicity - all-in-one deployment
+# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# DATABASE_ENGINE chooses SQLite (`sqlite`, the default, for an all-in-one
+# deployment) or PostgreSQL (`postgres`, for several serving replicas).
 
+DATABASE_ENGINE = env('DATABASE_ENGINE')
 DATABASE_PATH = env('DATABASE_PATH')
 
-# Ensure database directory exists
-os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+if DATABASE_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'HOST': env('DATABASE_HOST'),
+            'NAME': env('DATABASE_NAME'),
+            'PASSWORD': env('DATABASE_PASSWORD'),
+            'PORT': env('DATABASE_PORT'),
+            'USER': env('DATABASE_USER'),
+            # Server-side cursors don't work through a transaction-pooling
+            # proxy such as PgBouncer.
+            'DISABLE_SERVER_SIDE_CURSORS': env('DATABASE_POOLER'),
+        }
+    }
+elif DATABASE_ENGINE == 'sqlite':
+    # Ensure database directory exists
+    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DATABASE_PATH,
+            'OPTIONS': {
+                'timeout': 30,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        'DATABASE_ENGINE must be "sqlite" or "postgres".'
+    )
+
+# Each worker (or, with ASGI, each worker thread) keeps its connection open
+# between requests, so connections are pooled per process. With a pooling
+# proxy such as PgBouncer in front of PostgreSQL, also set DATABASE_POOLER.
+DATABASES['default']['CONN_MAX_AGE'] = None
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Connection tuning, applied in `books.db`:
+# - DATABASE_QUERY_ONLY makes connections read-only. The API server uses
+#   this, while management commands such as `updatecatalog` do not.
+# The rest only apply to SQLite:
+# - DATABASE_MMAP_SIZE is the number of bytes of the database file to memory
+#   map. It should be larger than the whole database.
+# - DATABASE_CACHE_SIZE is the SQLite page cache size for each connection,
+#   in pages if positive or in KiB if negative.
+DATABASE_QUERY_ONLY = env('DATABASE_QUERY_ONLY')
+DATABASE_MMAP_SIZE = env('DATABASE_MMAP_SIZE')
+DATABASE_CACHE_SIZE = env('DATABASE_CACHE_SIZE')
+
+# Catalog snapshots, for serving a SQLite catalog from several replicas
+# (see `books.snapshots`):
+# - SNAPSHOT_DIR is a directory shared by the catalog updater and the
+#   replicas, such as a volume that every pod mounts.
+# - SNAPSHOT_MODE is `publish` for the catalog updater, which publishes a
+#   snapshot of the database after each update, or `replica` for servers,
+#   which serve the newest snapshot and switch to new ones as they come. It
+#   is empty for neither.
+# - SNAPSHOT_CHECK_INTERVAL is the number of seconds between replicas'
+#   checks for new snapshots.
+# - SNAPSHOT_KEEP is the number of snapshots kept, so that replicas still
+#   reading older ones can finish with them.
+SNAPSHOT_DIR = env('SNAPSHOT_DIR')
+SNAPSHOT_MODE = env('SNAPSHOT_MODE')
+SNAPSHOT_CHECK_INTERVAL = env('SNAPSHOT_CHECK_INTERVAL')
+SNAPSHOT_KEEP = env('SNAPSHOT_KEEP')
+
+if SNAPSHOT_MODE not in ('', 'publish', 'replica'):
+    raise ImproperlyConfigured('SNAPSHOT_MODE must be "publish", "replica", or empty.')
+if SNAPSHOT_MODE and (DATABASE_ENGINE != 'sqlite' or not SNAPSHOT_DIR):
+    raise ImproperlyConfigured('Snapshots need SQLite and a SNAPSHOT_DIR.')
+if SNAPSHOT_MODE == 'replica':
+    # Snapshots are never written to.
+    DATABASE_QUERY_ONLY = True
+
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# A file-based cache is shared by all server worker processes on a machine.
+# Cached data is keyed by catalog version, so it expires with each update.
 
-DATABASES = {
+CACHE_DIR = env('CACHE_DIR')
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': DATABASE_PATH,
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
         'OPTIONS': {
-            'timeout': 30,
+            'MAX_ENTRIES': 10000,
         }
     }
 }
 
-DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+# Book list pages, in `books.pages`:
+# - PAGE_CACHE_MAX_PAGE is the last page number of each book list that is
+#   cached, as popular lists are mostly read from the start. It is 0 for no
+#   page caching.
+# - PAGE_CACHE_BODIES is whether pages' serialized books are cached along
+#   with their IDs and counts. Without them, only the books' rows are read.
+PAGE_CACHE_MAX_PAGE = env('PAGE_CACHE_MAX_PAGE')
+PAGE_CACHE_BODIES = env('PAGE_CACHE_BODIES')
 
 
 # Password validation
@@ -222,9 +354,92 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        'client': env('THROTTLE_RATE') or None,
+        'client_key': env('THROTTLE_KEY_RATE') or None,
+        'search': env('THROTTLE_SEARCH_RATE') or None,
+        'search_key': env('THROTTLE_SEARCH_KEY_RATE') or None,
+    },
+    'NUM_PROXIES': env('THROTTLE_PROXY_COUNT'),
     'PAGE_SIZE': 32
 }
 
+# Request throttling, applied in `books.throttling`:
+# - THROTTLE_RATE and THROTTLE_SEARCH_RATE limit the requests of each IP
+#   address, like '120/min', for all requests and for those with `search`
+#   or `topic`. An empty value, the default, turns a limit off, as clients
+#   behind a proxy would otherwise share one address and one limit.
+# - THROTTLE_KEY_RATE and THROTTLE_SEARCH_KEY_RATE are the same for clients
+#   that send one of API_KEYS in an X-API-Key header.
+# - THROTTLE_PROXY_COUNT is the number of proxies in front of the server,
+#   used to find clients' addresses in X-Forwarded-For headers.
+# - THROTTLE_DB_PATH is the SQLite file of request counters shared by all
+#   workers.
+API_KEYS = env('API_KEYS')
+THROTTLE_DB_PATH = env('THROTTLE_DB_PATH') or os.path.join(
+    CACHE_DIR, 'throttle.db'
+)
+
+# Book list guardrails, applied in `books.guardrails`:
+# - QUERY_COST_LIMIT is the largest allowed estimated cost of a book list's
+#   filter parameters. Costlier requests get a 400 response without running
+#   any queries. 0 turns this off.
+# - QUERY_TIME_LIMIT is the number of seconds that each SQL statement of a
+#   book list may run before it's stopped with a 503 response. 0 turns this
+#   off.
+QUERY_COST_LIMIT = env('QUERY_COST_LIMIT')
+QUERY_TIME_LIMIT = env('QUERY_TIME_LIMIT')
+
+
+# WARM_UP_WORKERS has each gunicorn worker read the hot parts of the
+# database and run common queries before taking requests (see
+# `books.warmup`).
+WARM_UP_WORKERS = env('WARM_UP_WORKERS')
+
+# Request profiling, applied in `books.profiling`:
+# - PROFILE_REQUESTS turns on timing of the phases and SQL statements of
+#   book requests, given in a Server-Timing header.
+# - SLOW_REQUEST_THRESHOLD is the number of seconds over which profiled
+#   requests are logged with their SQL and query plans.
+# - SLOW_REQUEST_LOG is the path of the file they're logged to. They go to
+#   standard error if it's empty.
+PROFILE_REQUESTS = env('PROFILE_REQUESTS')
+SLOW_REQUEST_THRESHOLD = env('SLOW_REQUEST_THRESHOLD')
+SLOW_REQUEST_LOG = env('SLOW_REQUEST_LOG')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_requests': {
+            'class': 'logging.FileHandler',
+            'filename': SLOW_REQUEST_LOG,
+        } if SLOW_REQUEST_LOG else {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'books.snapshots': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'books.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'books.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Cross-origin resource sharing with `corsheaders` middleware
 CORS_ALLOW_ALL_ORIGINS = True
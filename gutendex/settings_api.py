@@ -0,0 +1,72 @@
+"""
+These are lean settings for serving the public API, which is anonymous and
+read-only. They are the full settings in `gutendex.settings` without what
+only the admin site, logins, and forms use:
+
+- The admin, auth, contenttypes, sessions, and messages apps, so none of
+  their models, signals, or checks are loaded.
+- The session, CSRF, authentication, messages, and clickjacking
+  middleware, which every request passed through.
+- REST framework's authentication. Requests have no user, and permissions
+  are checked without looking up the view's queryset, as model permissions
+  were.
+
+Serve with DJANGO_SETTINGS_MODULE=gutendex.settings_api. Management
+commands, such as `migrate` and `updatecatalog`, use the full settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+
+API_UNUSED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.messages',
+    'django.contrib.sessions',
+}
+
+API_UNUSED_MIDDLEWARE = {
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+}
+
+API_UNUSED_CONTEXT_PROCESSORS = {
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_UNUSED_APPS]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE if middleware not in API_UNUSED_MIDDLEWARE
+]
+
+TEMPLATES = [
+    {
+        **template,
+        'OPTIONS': {
+            **template['OPTIONS'],
+            'context_processors': [
+                processor
+                for processor in template['OPTIONS']['context_processors']
+                if processor not in API_UNUSED_CONTEXT_PROCESSORS
+            ],
+        },
+    }
+    for template in TEMPLATES
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    # Without authentication, only safe methods are ever allowed.
+    'DEFAULT_PERMISSION_CLASSES': (
+        'rest_framework.permissions.IsAuthenticatedOrReadOnly',
+    ),
+    'UNAUTHENTICATED_USER': None,
+}
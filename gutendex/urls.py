@@ -1,15 +1,60 @@
+from django.conf import settings
 from django.urls import include, re_path
 from django.views.generic import TemplateView
 
 from rest_framework import routers
 
-from books import views
+from books import metrics, views
 
 
 router = routers.DefaultRouter()
+router.register(r'authors', views.AuthorViewSet, basename='author')
 router.register(r'books', views.BookViewSet)
+router.register(r'changes', views.CatalogChangeViewSet, basename='change')
 
 urlpatterns = [
     re_path(r'^$', TemplateView.as_view(template_name='home.html')),
+    re_path(r'^metrics$', metrics.metrics, name='metrics'),
+    re_path(r'^ready$', views.ready, name='ready'),
+]
+
+if settings.ASYNC_API:
+    urlpatterns += [
+        re_path(r'^authors/$', views.async_author_list, name='author-list'),
+        re_path(r'^books/$', views.async_book_list, name='book-list'),
+        re_path(
+            r'^books/autocomplete/$',
+            views.async_book_autocomplete,
+            name='book-autocomplete'
+        ),
+        re_path(
+            r'^books/facets/$',
+            views.async_book_facets,
+            name='book-facets'
+        ),
+        re_path(
+            r'^books/random/$',
+            views.async_book_random,
+            name='book-random'
+        ),
+        re_path(
+            r'^books/trending/$',
+            views.async_book_trending,
+            name='book-trending'
+        ),
+        re_path(
+            r'^books/(?P<gutenberg_id>[^/.]+)/related/$',
+            views.async_book_related,
+            name='book-related'
+        ),
+        re_path(
+            r'^books/(?P<gutenberg_id>[^/.]+)/$',
+            views.async_book_detail,
+            name='book-detail'
+        ),
+        re_path(r'^changes/$', views.async_catalog_change_list, name='change-list'),
+    ]
+
+urlpatterns += [
     re_path(r'^', include(router.urls)),
 ]